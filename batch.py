@@ -0,0 +1,222 @@
+"""
+batch.py
+
+"Command-line entry point that propagates a batch of schedule files for one
+    mission in parallel, and writes a summary row per schedule as soon as it
+    is done."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+from loader import load_power_frame
+from mission import Mission
+from runner import ScheduleRunner
+from schedule import Schedule
+
+
+# File types that schedules and mission setups can be read from
+schedule_suffixes = (".json", ".toml", ".csv")
+
+
+def read_table(path):
+    """Returns the contents of a JSON or TOML file as a dict."""
+
+    if path.endswith(".toml"):
+        try:
+            import tomllib
+        except ImportError:
+            raise ImportError("Reading TOML files requires Python 3.11 or \
+                              newer!")
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+
+    with open(path) as file:
+        return json.load(file)
+
+
+def schedule_time(value):
+    """Converts a schedule time read from a file to a number, keeping whole
+    seconds as an int."""
+    value = float(value)
+    return int(value) if value.is_integer() else value
+
+
+def load_schedule(path):
+    """Reads a schedule from a file, and returns it as a dict of
+    {time: OpState}, as taken by Mission.propagate().
+
+    JSON and TOML files hold a single table with the times as keys, e.g.
+    {"0": "idle", "1000": "recharge"}, either on its own or under the key
+    "schedule". CSV files hold a time and an OpState on every row, and may
+    start with a header row."""
+
+    if path.endswith(".csv"):
+        schedule = {}
+        with open(path, newline="") as file:
+            for i, row in enumerate(csv.reader(file)):
+                if not row:
+                    continue
+                try:
+                    time = schedule_time(row[0])
+                except ValueError:
+                    if i == 0:
+                        continue # Header row
+                    raise
+                schedule[time] = row[1].strip()
+        return schedule
+
+    table = read_table(path)
+    if "schedule" in table:
+        table = table["schedule"]
+    return {schedule_time(time): opstate for time, opstate in table.items()}
+
+
+def schedule_files(paths):
+    """Returns the schedule files among the given paths, and all schedule
+    files directly within the given directories, in sorted order."""
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) \
+                            for name in os.listdir(path) \
+                            if name.endswith(schedule_suffixes))
+        else:
+            files.append(path)
+    return files
+
+
+def load_mission(path, power, p_sun, p_alb):
+    """Builds the Mission described by a JSON or TOML file, which holds the
+    config, channels, device_channels and state_list, as in the example
+    scripts. The power frame and the input power arrays are read from their
+    own files."""
+
+    setup = read_table(path)
+    return Mission(setup["config"], setup["device_channels"], \
+                   setup["state_list"], setup["channels"], \
+                   load_power_frame(power), np.load(p_sun), np.load(p_alb))
+
+
+class SummaryWriter:
+    """This class writes summary rows as CSV or as JSON lines, and flushes
+    every row as soon as it is written, so that the rows can be read by
+    another program while the batch is still running."""
+
+    def __init__(self, file, columns, output_format="csv"):
+        self.file = file
+        self.output_format = output_format
+
+        if output_format == "csv":
+            self.writer = csv.DictWriter(file, fieldnames=columns)
+            self.writer.writeheader()
+        elif output_format != "jsonl":
+            raise ValueError("Unknown output format '{}'! Choose either \
+                             'csv' or 'jsonl'.".format(output_format))
+
+    def write(self, row):
+        if self.output_format == "csv":
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Propagates a batch of \
+        schedules for one mission in parallel, and writes a summary row \
+        per schedule as soon as it is done.")
+
+    parser.add_argument("schedules", nargs="+", help="Schedule files \
+        (.json, .toml or .csv), or directories holding them.")
+    parser.add_argument("--mission", default="mission.json", help="JSON or \
+        TOML file with the config, channels, device_channels and \
+        state_list (default: mission.json).")
+    parser.add_argument("--power", default="power.xlsx", help="Power frame \
+        spreadsheet (default: power.xlsx).")
+    parser.add_argument("--p-sun", default="P_sun.npy", help="Input power \
+        from sunlight (default: P_sun.npy).")
+    parser.add_argument("--p-alb", default="P_alb.npy", help="Input power \
+        from albedo (default: P_alb.npy).")
+    parser.add_argument("--tsim", type=float, required=True, help="Total \
+        simulation length in [s].")
+    parser.add_argument("--dt", type=float, default=1, help="Timestep in \
+        [s] (default: 1).")
+    parser.add_argument("--mode", choices=("step", "segment"), \
+        default="step", help="Propagation mode (default: step).")
+    parser.add_argument("--workers", type=int, default=None, help="Number \
+        of worker processes (default: one per processor core).")
+    parser.add_argument("--output", default=None, help="File to write the \
+        summaries to (default: standard output).")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default=None, \
+        help="Output format (default: from the extension of --output, or \
+        csv).")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+
+    mission = load_mission(arguments.mission, arguments.power, \
+                           arguments.p_sun, arguments.p_alb)
+
+    # Read all schedules up front, so that a faulty file is reported
+    #   before the batch starts rather than halfway through.
+    schedules = {}
+    for path in schedule_files(arguments.schedules):
+        try:
+            schedule = load_schedule(path)
+        except (OSError, ValueError, KeyError, IndexError, AttributeError, \
+                TypeError) as error:
+            print("Skipping {}: {}".format(path, error), file=sys.stderr)
+            continue
+
+        if not schedule:
+            print("Skipping {}: empty schedule".format(path), \
+                  file=sys.stderr)
+            continue
+
+        # Compiled once here, so that every worker gets the arrays
+        try:
+            schedules[path] = Schedule.compile(schedule, mission.state_list)
+        except ValueError as error:
+            print("Skipping {}: {}".format(path, " ".join(str(error).split())),\
+                  file=sys.stderr)
+
+    output_format = arguments.format
+    if output_format is None:
+        output_format = "jsonl" if arguments.output \
+            and arguments.output.endswith((".jsonl", ".json")) else "csv"
+
+    columns = ["schedule", "battery_min", "t_battery_min", "battery_max", \
+               "battery_end", "soc_min", "soc_end", "t_full", "t_empty", \
+               "e_in", "e_out"]
+
+    file = open(arguments.output, "w", newline="") if arguments.output \
+        else sys.stdout
+    try:
+        writer = SummaryWriter(file, columns, output_format)
+        with ScheduleRunner(mission, tsim=arguments.tsim, dt=arguments.dt, \
+                            mode=arguments.mode, \
+                            workers=arguments.workers) as runner:
+            for path, summary in runner.run(schedules):
+                row = {"schedule" : path}
+                row.update({key: float(value) \
+                            for key, value in summary.items()})
+                writer.write(row)
+    finally:
+        if file is not sys.stdout:
+            file.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""
+benchmark.py
+
+"Benchmark suite for the propagation engine and the plotting methods of the
+    Mission class, on synthetic inputs."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from mission import Mission
+
+
+# Case around which every parameter is swept, one at a time
+base_case = {"tsim" : 86400, "dt" : 1, "entries" : 100, "devices" : 11, \
+             "channels" : 10}
+
+sweeps = {
+    "tsim"      : [10000, 86400, 864000],
+    "dt"        : [0.5, 1, 10, 60],
+    "entries"   : [10, 100, 1000, 10000],
+    "devices"   : [5, 50, 500],
+    "channels"  : [5, 50, 500],
+    }
+
+# Smaller sweeps for a quick check
+quick_sweeps = {
+    "tsim"      : [10000, 86400],
+    "dt"        : [1, 60],
+    "entries"   : [10, 1000],
+    "devices"   : [5, 50],
+    "channels"  : [5, 50],
+    }
+
+# Number of OpStates of every synthetic mission
+n_states = 9
+
+# Cases of the consistency check, with timesteps that do not divide the
+#   schedule switches or the simulation length
+check_tsims = [5214, 10000]
+check_dts = [1, 10, 0.1, 0.5, 3.3, 6.6]
+
+
+def synthetic_mission(devices, channels, seed=0):
+    """Builds a Mission with the given number of devices and channels from
+    synthetic inputs: a random power frame, and input power profiles with
+    a sunlit part shaped like a sine and an eclipse of 36% of the orbit,
+    like those of P_sun.npy and P_alb.npy."""
+    rng = np.random.default_rng(seed)
+
+    config = {
+        "years_passed" : 0,
+        "battery_capacity" : 81000,
+        "battery_degradation_factor" : 0.04,
+        "battery_init" : 0.5,
+        "panel_degradation_factor" : 0.02,
+        "blip_period" : 30,
+        "blip_duration" : 1,
+        "no_blips" : ["state_0"],
+        "orbital_altitude" : 550,
+        }
+
+    channel_list = ["None"] + ["channel_{}".format(i) \
+                               for i in range(channels-1)]
+    device_channels = {"device_{}".format(i) : \
+                       channel_list[rng.integers(len(channel_list))] \
+                       for i in range(devices)}
+    state_list = ["state_{}".format(i) for i in range(n_states)]
+
+    # Every device uses either nothing or up to 1 W in each OpState
+    power = rng.uniform(0, 1000, (devices, n_states)) \
+        * (rng.random((devices, n_states)) < 0.5)
+    # Scale the total so that the battery both charges and discharges
+    power *= 3000/max(power.sum(axis=0).mean(), 1)
+    power_frame = pd.DataFrame(power, index=list(device_channels), \
+                               columns=state_list)
+
+    phase = np.linspace(0, 1, 500)
+    sunlit = phase < 0.64
+    angle = np.pi*np.minimum(phase/0.64, 1)
+    p_sun = np.where(sunlit, 7*np.sin(angle)**0.5, 0)
+    p_alb = np.where(sunlit, 0.5*np.sin(angle), 0)
+
+    return Mission(config, device_channels, state_list, channel_list, \
+                   power_frame, p_sun, p_alb)
+
+
+def synthetic_schedule(entries, tsim, seed=0):
+    """Returns a schedule of the given number of entries with random
+    OpStates, spread evenly over tsim seconds."""
+    rng = np.random.default_rng(seed)
+    times = np.round(np.linspace(0, tsim, entries, endpoint=False))
+    states = rng.integers(n_states, size=entries)
+    return {int(t): "state_{}".format(state) \
+            for t, state in zip(times, states)}
+
+
+def timed(function, repeat):
+    """Returns the best wall time in [s] of calling function repeat times,
+    with its console output suppressed."""
+    best = np.inf
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            begin = time.perf_counter()
+            function()
+            best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def propagate_benchmarks(mission, schedule, case):
+    """Returns the propagation benchmarks of a case, as a dict of
+    functions."""
+    tsim, dt = case["tsim"], case["dt"]
+    return {
+        "propagate_step" : lambda: mission.propagate(schedule, tsim, dt),
+        "propagate_segment" : lambda: mission.propagate(schedule, tsim, dt, \
+                                                        mode="segment"),
+        "propagate_compact" : lambda: mission.propagate(schedule, tsim, dt, \
+                                                        compact=True),
+        "propagate_segments" : lambda: mission.propagate_segments(schedule, \
+                                                                  tsim, dt),
+        }
+
+
+def plot_benchmarks(mission):
+    """Returns the plotting benchmarks of the last simulation of the
+    mission, as a dict of functions. Every figure is drawn in full and
+    closed again."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    opstate_colours = {state: "C{}".format(i % 10) \
+                       for i, state in enumerate(mission.state_list)}
+    channel_voltages = {channel: 5 for channel in mission.channels \
+                        if channel != "None"}
+
+    def drawn(plot, *args, **kwargs):
+        def function():
+            plot(*args, **kwargs)
+            for number in plt.get_fignums():
+                plt.figure(number).canvas.draw()
+            plt.close("all")
+        return function
+
+    return {
+        "plot_timeline_power" : drawn(mission.plot_timeline_power, \
+                                      opstate_colours, show=False),
+        "plot_timeline_device" : drawn(mission.plot_timeline_device),
+        "plot_timeline_channel" : drawn(mission.plot_timeline_channel),
+        "plot_timeline_channel_currents" : \
+            drawn(mission.plot_timeline_channel_currents, channel_voltages),
+        "plot_pie_device" : drawn(mission.plot_pie_device, show=False),
+        "plot_pie_opstate" : drawn(mission.plot_pie_opstate, \
+                                   opstate_colours, show=False),
+        "plot_bar_channel" : drawn(mission.plot_bar_channel),
+        }
+
+
+def cases(sweeps):
+    """Returns every case of the sweeps, each differing from the base case
+    in one parameter, without duplicates."""
+    result = []
+    for parameter, values in sweeps.items():
+        for value in values:
+            case = dict(base_case, **{parameter : value})
+            if case not in result:
+                result.append(case)
+    return result
+
+
+def case_name(case):
+    return ",".join("{}={}".format(key, value) for key, value in case.items())
+
+
+def run(sweeps, repeat=3, plots=True, selection=None):
+    """Runs every benchmark of every case, and returns the timings as a
+    dict of {case name: {benchmark: time in [s]}}."""
+    results = {}
+
+    for case in cases(sweeps):
+        mission = synthetic_mission(case["devices"], case["channels"])
+        schedule = synthetic_schedule(case["entries"], case["tsim"])
+
+        benchmarks = propagate_benchmarks(mission, schedule, case)
+        timings = {}
+        for name, function in benchmarks.items():
+            if selection is None or any(s in name for s in selection):
+                timings[name] = timed(function, repeat)
+
+        if plots:
+            with contextlib.redirect_stdout(io.StringIO()):
+                mission.propagate(schedule, case["tsim"], case["dt"])
+            for name, function in plot_benchmarks(mission).items():
+                if selection is None or any(s in name for s in selection):
+                    timings[name] = timed(function, 1)
+
+        results[case_name(case)] = timings
+        print(case_name(case), file=sys.stderr)
+        for name, seconds in timings.items():
+            print("    {:32s} {:10.4f} s".format(name, seconds), \
+                  file=sys.stderr)
+
+    return results
+
+
+def check(tsims=check_tsims, dts=check_dts, tolerance=1e-6):
+    """Checks that propagate() in segment mode and propagate_segments() give
+    the same battery as step mode on a synthetic mission, for both input
+    modes. Returns the cases where they differ by more than tolerance in
+    [J]."""
+    mission = synthetic_mission(base_case["devices"], base_case["channels"])
+    failures = []
+
+    for tsim in tsims:
+        schedule = synthetic_schedule(base_case["entries"], tsim)
+        for dt in dts:
+            for input_mode in ["sample", "average"]:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    step = mission.propagate(schedule, tsim, dt, \
+                        input_mode=input_mode)["battery"].to_numpy()
+                    segment = mission.propagate(schedule, tsim, dt, \
+                        mode="segment", \
+                        input_mode=input_mode)["battery"].to_numpy()
+                    segments = mission.propagate_segments(schedule, tsim, \
+                        dt, input_mode=input_mode)
+
+                error = max(np.abs(segment - step).max(), \
+                            abs(segments["battery_end"].iloc[-1] - step[-1]))
+                name = "tsim={},dt={},input_mode={}".format(tsim, dt, \
+                                                            input_mode)
+                print("{:48s} {:10.3g} J".format(name, error), \
+                      file=sys.stderr)
+                if len(segment) != len(step) or error > tolerance:
+                    failures.append(name)
+
+    return failures
+
+
+def commit():
+    """Returns the hash of the current git commit, or None outside of a git
+    repository."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], \
+            capture_output=True, text=True, check=True, \
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new, threshold=1.2):
+    """Prints the ratio of the timings of two stored benchmark runs for
+    every benchmark they have in common, and returns the names of those
+    that got slower by more than threshold."""
+    regressions = []
+    print("{:60s} {:32s} {:>10s} {:>10s} {:>7s}".format("case", \
+          "benchmark", "old [s]", "new [s]", "ratio"))
+
+    for case, timings in new["results"].items():
+        for name, seconds in timings.items():
+            if name not in old["results"].get(case, {}):
+                continue
+            before = old["results"][case][name]
+            ratio = seconds/before if before > 0 else np.inf
+            flag = " <" if ratio > threshold else ""
+            print("{:60s} {:32s} {:10.4f} {:10.4f} {:7.2f}{}".format(case, \
+                  name, before, seconds, ratio, flag))
+            if ratio > threshold:
+                regressions.append((case, name))
+
+    return regressions
+
+
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks the \
+        propagation engine and the plotting methods on synthetic inputs, \
+        and stores the timings per git commit.")
+
+    parser.add_argument("--quick", action="store_true", help="Run the \
+        smaller sweeps.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of \
+        runs of each propagation benchmark, of which the best is kept \
+        (default: 3).")
+    parser.add_argument("--no-plots", action="store_true", help="Skip the \
+        plotting benchmarks.")
+    parser.add_argument("--only", nargs="+", default=None, help="Only run \
+        the benchmarks whose name contains any of these.")
+    parser.add_argument("--output", default=None, help="File to store the \
+        timings in (default: benchmarks/<commit>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), \
+        help="Compare two stored runs instead of running the benchmarks.")
+    parser.add_argument("--check", action="store_true", help="Check that \
+        the segment-wise integration agrees with step mode instead of \
+        running the benchmarks.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Ratio \
+        of new to old time above which --compare reports a regression \
+        (default: 1.2).")
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    arguments = parse_arguments(argv)
+
+    if arguments.compare:
+        with open(arguments.compare[0]) as file:
+            old = json.load(file)
+        with open(arguments.compare[1]) as file:
+            new = json.load(file)
+        regressions = compare(old, new, arguments.threshold)
+        sys.exit(1 if regressions else 0)
+
+    if arguments.check:
+        failures = check()
+        for name in failures:
+            print("Segment mode differs from step mode:", name, \
+                  file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+    results = run(quick_sweeps if arguments.quick else sweeps, \
+                  arguments.repeat, not arguments.no_plots, arguments.only)
+
+    revision = commit()
+    stored = {
+        "commit" : revision,
+        "date" : datetime.datetime.now().isoformat(timespec="seconds"),
+        "python" : platform.python_version(),
+        "numpy" : np.__version__,
+        "pandas" : pd.__version__,
+        "machine" : platform.machine(),
+        "base_case" : base_case,
+        "results" : results,
+        }
+
+    output = arguments.output
+    if output is None:
+        output = os.path.join("benchmarks", "{}.json".format( \
+            revision or "results"))
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(stored, file, indent=1)
+    print("Stored timings in", output, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
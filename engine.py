@@ -0,0 +1,1176 @@
+"""
+engine.py
+
+"Array kernels used by the Mission class to propagate a schedule. Each
+    function works on whole timelines at once, so that the Mission class
+    never has to step through a simulation entry by entry."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import math
+
+import numpy as np
+
+
+def timeline(tsim, dt):
+    """
+    Parameters
+    ----------
+    tsim : double
+        Total simulation length in [s].
+    dt : double
+        Timestep in [s].
+
+    Returns
+    -------
+    ndarray
+        Simulation times in [s]. The times are accumulated step by step
+        (t += dt), exactly like a running clock would, and include every
+        time up to and including tsim.
+
+    """
+    if tsim < 0:
+        return np.zeros(0, dtype=np.asarray(dt).dtype)
+
+    t = clock(int(np.floor(tsim/dt)) + 2, dt)
+
+    return t[t <= tsim]
+
+
+def clock(steps, dt):
+    """
+    Parameters
+    ----------
+    steps : int
+        Number of steps.
+    dt : double
+        Timestep in [s].
+
+    Returns
+    -------
+    ndarray
+        The first steps times in [s] of the running clock of timeline().
+
+    """
+    t = np.zeros(steps, dtype=np.asarray(dt).dtype)
+    # np.cumsum adds sequentially, so every entry carries the same rounding
+    #   as repeatedly adding dt to a running clock.
+    t[1:] = np.cumsum(np.full(steps-1, dt))
+
+    return t
+
+
+def exact_clock(dt, steps):
+    """Returns whether the first steps times of the clock of timeline() are
+    exact multiples of dt. This holds for a whole number of seconds or a
+    binary fraction of one, such as 0.5 or 2.25, which add up without
+    rounding, but not for e.g. 0.1 or 3.3."""
+    numerator, denominator = float(dt).as_integer_ratio()
+    return steps*abs(numerator) < 2**53
+
+
+def timeline_length(tsim, dt):
+    """Returns the number of times in timeline(tsim, dt). If the clock holds
+    exact multiples of dt, the count follows without building the
+    timeline."""
+    if tsim < 0:
+        return 0
+    if exact_clock(dt, int(np.floor(tsim/dt)) + 2):
+        last = np.floor(tsim/dt)
+        # Correct for the rounding of the division
+        last += (last+1)*dt <= tsim
+        last -= last*dt > tsim
+        return int(last) + 1
+    return len(timeline(tsim, dt))
+
+
+def timeline_chunks(tsim, dt, chunk_size):
+    """
+    Parameters
+    ----------
+    tsim : double
+        Total simulation length in [s].
+    dt : double
+        Timestep in [s].
+    chunk_size : int
+        Number of steps per chunk.
+
+    Yields
+    ------
+    ndarray
+        Successive runs of at most chunk_size simulation times in [s], which
+        together are identical to timeline(tsim, dt).
+
+    """
+    start = np.zeros(1, dtype=np.asarray(dt).dtype)[0]
+
+    while start <= tsim:
+        t = np.cumsum(np.concatenate(([start], np.full(chunk_size-1, dt))))
+        t = t[t <= tsim]
+
+        yield t
+
+        start = t[-1] + dt
+
+
+def schedule_index(t, switch_times, entry=0):
+    """
+    Parameters
+    ----------
+    t : ndarray
+        Simulation times in [s], as given by timeline(), or any run of
+        consecutive times from it.
+    switch_times : ndarray
+        Sorted times in [s] at which the schedule switches to a new entry.
+    entry : int, optional
+        Schedule entry that is active just before the first time in t.
+        Defaults to 0, the first entry.
+
+    Returns
+    -------
+    ndarray
+        Index of the schedule entry that is active at each time in t.
+
+        The schedule moves forward by at most one entry per timestep, so if
+        several switches fall within a single step, the later entries are
+        picked up one step at a time.
+
+    """
+    steps = np.arange(len(t))
+
+    # Latest entry that has started at each time
+    latest = np.searchsorted(switch_times, t, side="right") - 1
+    latest = np.maximum(latest, 0)
+
+    # Advancing by at most one entry per step means that the active entry
+    #   at step k is min(latest[j] + k - j) over all j <= k, with an extra
+    #   bound of entry + k + 1 coming from the entry active at step -1.
+    lag = np.minimum.accumulate(latest - steps)
+
+    return steps + np.minimum(lag, entry+1)
+
+
+def sample_input(p_in_profile, t, dt, input_mode="sample"):
+    """
+    Parameters
+    ----------
+    p_in_profile : ndarray
+        Input power over one orbit, sampled once per second. Sample i is
+        taken to hold from second i up to second i+1.
+    t : ndarray
+        Simulation times in [s].
+    dt : double or ndarray
+        Timestep in [s], either the same for every step or one per step.
+    input_mode : str, optional
+        "sample" to take the input power at time t, rounded to the nearest
+        second, or "average" to take the exact average of the input power
+        over each step [t, t+dt). Defaults to "sample".
+
+    Returns
+    -------
+    ndarray
+        Input power during each step, in the same unit as p_in_profile.
+
+        With "average", the energy going in during a step is exact for any
+        timestep, also when the step lies across an eclipse edge. For dt=1
+        and whole-second times, both modes agree up to floating-point
+        rounding.
+
+    """
+    length = len(p_in_profile)
+
+    if input_mode == "sample":
+        return p_in_profile[np.round(t).astype(int)%length]
+
+    if input_mode != "average":
+        raise ValueError("Unknown input mode '{}'! Choose either 'sample' \
+                         or 'average'.".format(input_mode))
+
+    cum = np.concatenate(([0.], np.cumsum(p_in_profile)))
+
+    def integral(x):
+        # Integral of the profile from the start of the orbit up to x,
+        #   split into whole orbits and the part within the last orbit.
+        orbits, rest = np.divmod(x, length)
+        second = np.minimum(np.floor(rest).astype(int), length-1)
+        return orbits, cum[second] + (rest-second)*p_in_profile[second]
+
+    orbits_start, part_start = integral(np.asarray(t, dtype=float))
+    orbits_end, part_end = integral(np.asarray(t, dtype=float) + dt)
+
+    return ((orbits_end-orbits_start)*cum[-1] + part_end - part_start)/dt
+
+
+def sample_input_orbits(p_in_profiles, orbit_rows, first_orbit, t, dt, \
+                        input_mode="sample"):
+    """
+    Parameters
+    ----------
+    p_in_profiles : ndarray
+        Input power profiles of one orbit each, with shape (profiles,
+        length), sampled once per second like in sample_input().
+    orbit_rows : ndarray
+        Row of p_in_profiles that holds during each orbit, starting from
+        orbit first_orbit and covering every orbit that t and t+dt lie in.
+    first_orbit : int
+        Number of the orbit that orbit_rows starts with, counting the
+        orbit starting at t=0 as orbit 0.
+    t : ndarray
+        Simulation times in [s].
+    dt : double or ndarray
+        Timestep in [s], either the same for every step or one per step.
+    input_mode : str, optional
+        "sample" or "average", see sample_input(). Defaults to "sample".
+
+    Returns
+    -------
+    ndarray
+        Input power during each step, in the same unit as p_in_profiles.
+
+        If every orbit uses the same row, this agrees with sample_input()
+        on that row, exactly for "sample" and up to floating-point rounding
+        for "average". A step across the end of an orbit is averaged over
+        the profiles of both orbits.
+
+    """
+    length = p_in_profiles.shape[1]
+
+    if input_mode == "sample":
+        orbits, second = np.divmod(np.round(t).astype(int), length)
+        return p_in_profiles[orbit_rows[orbits-first_orbit], second]
+
+    if input_mode != "average":
+        raise ValueError("Unknown input mode '{}'! Choose either 'sample' \
+                         or 'average'.".format(input_mode))
+
+    cum = np.concatenate((np.zeros((len(p_in_profiles), 1)), \
+                          np.cumsum(p_in_profiles, axis=1)), axis=1)
+    # Energy from the start of first_orbit up to the start of each orbit
+    orbit_cum = np.concatenate(([0.], np.cumsum(cum[orbit_rows, -1])))
+
+    def integral(x):
+        orbits, rest = np.divmod(x, length)
+        orbits = orbits.astype(int) - first_orbit
+        second = np.minimum(np.floor(rest).astype(int), length-1)
+        rows = orbit_rows[orbits]
+        return orbit_cum[orbits] + cum[rows, second] \
+            + (rest-second)*p_in_profiles[rows, second]
+
+    t = np.asarray(t, dtype=float)
+    return (integral(t + dt) - integral(t))/dt
+
+
+def blip_time(x, blip_period, blip_duration):
+    """Returns the total time in [s] spent in telemetry blips from 0 up to
+    each of the times x in [s], with a blip of blip_duration seconds at the
+    start of every blip_period seconds."""
+    cycles, rest = np.divmod(x, blip_period)
+    return cycles*blip_duration + np.minimum(rest, blip_duration)
+
+
+def blip_fraction(t, dt, blip_period, blip_duration):
+    """
+    Parameters
+    ----------
+    t : ndarray
+        Simulation times in [s].
+    dt : double or ndarray
+        Timestep in [s], either the same for every step or one per step.
+    blip_period : double
+        Time in [s] from the start of one telemetry blip to the next. The
+        first blip starts at t=0.
+    blip_duration : double
+        Length of each blip in [s].
+
+    Returns
+    -------
+    ndarray
+        Fraction of each step [t, t+dt) spent in a blip, so that the power
+        of the blips averaged over each step is exact for any timestep. For
+        whole-second times and dt=1, blips of whole seconds come out as
+        steps that are either fully on or fully off.
+
+    """
+    t = np.asarray(t, dtype=float)
+    return (blip_time(t + dt, blip_period, blip_duration) \
+            - blip_time(t, blip_period, blip_duration))/dt
+
+
+def integrate_battery(battery, delta, batt_cap):
+    """
+    Parameters
+    ----------
+    battery : double
+        Battery charge at the start of the integration in [J].
+    delta : ndarray
+        Change in battery charge during each timestep in [J].
+    batt_cap : double
+        Battery capacity in [J].
+
+    Returns
+    -------
+    ndarray
+        Battery charge in [J] at the end of each timestep, clamped between
+        0 and batt_cap after every step.
+
+    """
+    levels = []
+
+    for step_delta in delta.tolist():
+        battery += step_delta
+
+        # Preventing battery values from going out of bounds
+        if battery > batt_cap:
+            battery = batt_cap
+        elif battery < 0:
+            battery = 0
+
+        levels.append(battery)
+
+    return np.array(levels, dtype=float)
+
+
+def integrate_battery_batch(battery, delta, batt_cap):
+    """
+    Parameters
+    ----------
+    battery : ndarray
+        Battery charge of each variant at the start of the integration in
+        [J], with shape (variants,).
+    delta : ndarray
+        Change in battery charge during each timestep in [J], with shape
+        (steps, variants).
+    batt_cap : ndarray
+        Battery capacity of each variant in [J], with shape (variants,).
+
+    Returns
+    -------
+    ndarray
+        Battery charge in [J] at the end of each timestep, with shape
+        (steps, variants). The .T of this array gives the charge as
+        (variants, steps).
+
+        All variants are integrated together, one step at a time, with the
+        same clamping as integrate_battery().
+
+    """
+    levels = np.array(delta, dtype=float)
+    level = np.array(battery, dtype=float)
+
+    # Each row of levels starts out as the change in charge, and is turned
+    #   into the charge itself in place.
+    for row in levels:
+        row += level
+
+        # Preventing battery values from going out of bounds
+        np.minimum(row, batt_cap, out=row)
+        np.maximum(row, 0, out=row)
+
+        level = row
+
+    return levels
+
+
+def integrate_cycles(battery, delta, batt_cap, cycles, last_steps=None):
+    """
+    Parameters
+    ----------
+    battery : double
+        Battery charge at the start of the first cycle in [J].
+    delta : ndarray
+        Change in battery charge during each timestep of one cycle in [J].
+        Every cycle repeats the same steps.
+    batt_cap : double
+        Battery capacity in [J].
+    cycles : int
+        Number of cycles.
+    last_steps : int, optional
+        Number of steps of the last cycle, which may be cut short. Defaults
+        to a full cycle.
+
+    Returns
+    -------
+    dict
+        Per cycle, as arrays of length cycles: the battery charge at the
+        start ("start") and end ("end") in [J], the lowest ("min") and
+        highest ("max") charge after any step in [J] along with the step 
+        within the cycle at which they are first reached ("argmin", 
+        "argmax"), and the number of steps with a full ("steps_full") or
+        empty ("steps_empty") battery.
+
+        A cycle in which the battery neither runs full nor empty only shifts
+        the charge by the sum of delta, so a run of such cycles is filled in
+        at once, up to floating-point rounding. Only cycles in which the
+        battery runs full or empty are integrated step by step, and once a
+        full cycle ends at the charge it started at, every later cycle is 
+        the same as that one.
+
+    """
+    steps = len(delta)
+    if last_steps is None:
+        last_steps = steps
+
+    cum = np.cumsum(delta)
+    i_low, i_high = int(np.argmin(cum)), int(np.argmax(cum))
+    low, high, net = cum[i_low], cum[i_high], cum[-1]
+
+    result = {key: np.zeros(cycles) for key in ("start", "end", "min", \
+                                                 "max")}
+    result.update({key: np.zeros(cycles, dtype=int) for key in ("argmin", \
+                   "argmax", "steps_full", "steps_empty")})
+
+    def store(run, start, levels):
+        i_min, i_max = np.argmin(levels), np.argmax(levels)
+        result["start"][run] = start
+        result["end"][run] = levels[-1]
+        result["min"][run], result["argmin"][run] = levels[i_min], i_min
+        result["max"][run], result["argmax"][run] = levels[i_max], i_max
+        result["steps_full"][run] = np.count_nonzero(levels == batt_cap)
+        result["steps_empty"][run] = np.count_nonzero(levels == 0)
+
+    cycle = 0
+    level = float(battery)
+    while cycle < cycles:
+
+        # The last cycle may be cut short, so it is always integrated
+        full_cycles = cycles - 1 - cycle
+
+        if full_cycles > 0 and level + low > 0 and level + high < batt_cap:
+            # Number of cycles for which the charge stays within bounds
+            if net < 0:
+                count = np.ceil((level + low)/-net)
+            elif net > 0:
+                count = np.ceil((batt_cap - level - high)/net)
+            else:
+                count = full_cycles
+            count = int(min(count, full_cycles))
+
+            starts = level + np.arange(count)*net
+            run = slice(cycle, cycle+count)
+            result["start"][run] = starts
+            result["end"][run] = starts + net
+            result["min"][run] = starts + low
+            result["argmin"][run] = i_low
+            result["max"][run] = starts + high
+            result["argmax"][run] = i_high
+
+            cycle += count
+            level = level + count*net
+            continue
+
+        n = steps if full_cycles > 0 else last_steps
+        levels = integrate_battery(level, delta[:n], batt_cap)
+        store(cycle, level, levels)
+
+        if full_cycles > 1 and levels[-1] == level:
+            # Fixed point: every later full cycle repeats this one
+            store(slice(cycle+1, cycles-1), level, levels)
+            cycle = cycles - 1
+        else:
+            level = levels[-1]
+            cycle += 1
+
+    return result
+
+
+def cycle_map(delta, batt_cap):
+    """
+    Parameters
+    ----------
+    delta : ndarray
+        Change in battery charge during each timestep of one cycle in [J].
+    batt_cap : double
+        Battery capacity in [J].
+
+    Returns
+    -------
+    tuple
+        (net, low, high) in [J], such that a cycle that starts at charge x
+        ends at np.clip(x + net, low, high).
+
+        Each step clamps x + d to [0, batt_cap], and clamping twice is again
+        a clamp: clip(clip(x + a, l, h) + d, 0, c) equals 
+        clip(x + a + d, clip(l + d, 0, c), clip(h + d, 0, c)). So the bounds
+        of the whole cycle are where a cycle ends that starts out empty or
+        full after its first step.
+
+    """
+    net = np.sum(delta)
+    if len(delta) < 2:
+        return net, 0., float(batt_cap)
+
+    low = integrate_battery(0., delta[1:], batt_cap)[-1]
+    high = integrate_battery(batt_cap, delta[1:], batt_cap)[-1]
+    return net, low, high
+
+
+def limit_cycle(battery, net, low, high):
+    """
+    Parameters
+    ----------
+    battery : double
+        Battery charge at the start of the first cycle in [J].
+    net, low, high : double
+        The map of one cycle, as given by cycle_map().
+
+    Returns
+    -------
+    tuple
+        (battery, cycles): the charge in [J] at the start of every cycle
+        once the battery has settled into a limit cycle, and the number of
+        cycles it takes to get there from the given charge.
+
+        A cycle that gains charge settles at high, and one that loses
+        charge at low. Every cycle after the first starts within [low,
+        high], and moves net closer to the limit each time, so the number
+        of cycles follows without simulating them. If the net change is
+        zero, every charge within [low, high] repeats itself.
+
+    """
+    first = min(max(battery + net, low), high)
+
+    if net > 0:
+        limit = high
+    elif net < 0:
+        limit = low
+    else:
+        limit = first
+
+    if battery == limit:
+        return limit, 0
+    if first == limit:
+        return limit, 1
+    return limit, 1 + int(np.ceil(abs(limit - first)/abs(net)))
+
+
+class BatteryStats:
+    """This class keeps running statistics of the battery charge and the
+    energy balance over successive runs of steps, so that a simulation can
+    be judged without keeping the charge at every step."""
+    
+    def __init__(self, battery, batt_cap, states):
+        
+        self.batt_cap = batt_cap
+        self.battery_min = np.inf
+        self.battery_max = -np.inf
+        self.t_battery_min = None
+        self.t_battery_max = None
+        self.battery_end = battery
+        self.t_end = None
+        
+        # Highest charge so far, for the depth of discharge
+        self.peak = battery
+        self.discharge = 0.
+        
+        self.steps = 0
+        self.steps_full = 0
+        self.steps_empty = 0
+        
+        # Number of steps and summed P_in and P_out per OpState
+        self.state_steps = np.zeros(states, dtype=int)
+        self.state_p_in = np.zeros(states)
+        self.state_p_out = np.zeros(states)
+    
+    def update(self, t, opstate_idx, p_in, p_out, battery):
+        """Takes in the next run of steps, with the battery charge after
+        each step."""
+        if len(t) == 0:
+            return
+        
+        # Strict comparisons keep the first time an extreme is reached
+        i = np.argmin(battery)
+        if battery[i] < self.battery_min:
+            self.battery_min, self.t_battery_min = battery[i], t[i]
+        i = np.argmax(battery)
+        if battery[i] > self.battery_max:
+            self.battery_max, self.t_battery_max = battery[i], t[i]
+        
+        peaks = np.maximum(np.maximum.accumulate(battery), self.peak)
+        self.discharge = max(self.discharge, (peaks - battery).max())
+        self.peak = peaks[-1]
+        
+        self.steps += len(t)
+        self.steps_full += np.count_nonzero(battery == self.batt_cap)
+        self.steps_empty += np.count_nonzero(battery == 0)
+        
+        states = len(self.state_steps)
+        self.state_steps += np.bincount(opstate_idx, minlength=states)
+        self.state_p_in += np.bincount(opstate_idx, weights=p_in, \
+                                       minlength=states)
+        self.state_p_out += np.bincount(opstate_idx, weights=p_out, \
+                                        minlength=states)
+        
+        self.battery_end = battery[-1]
+        self.t_end = t[-1]
+
+
+def segment_starts(switch_times, dt, steps):
+    """
+    Parameters
+    ----------
+    switch_times : ndarray
+        Sorted times in [s] at which the schedule switches to a new entry.
+    dt : double
+        Timestep in [s].
+    steps : int
+        Total number of steps in the simulation.
+
+    Returns
+    -------
+    ndarray
+        Step at which each schedule entry becomes active, following the
+        same one-entry-per-step advance as schedule_index(), on the clock
+        of timeline(). Entries that would only start after the last step
+        are left out.
+
+    """
+    switch_times = np.asarray(switch_times, dtype=float)
+    entries = np.arange(len(switch_times))
+
+    # First step that lies at or after each switch time
+    if exact_clock(dt, steps):
+        # The clock holds exact multiples of dt, so this follows from a
+        #   division, corrected for its rounding.
+        first = np.ceil(switch_times/dt)
+        first += first*dt < switch_times
+        first -= (first-1)*dt >= switch_times
+        first = first.astype(int)
+    else:
+        # Otherwise, every time on the clock carries the rounding of adding
+        #   up dt, so the switch times are looked up on the clock itself.
+        first = np.searchsorted(clock(steps, dt), switch_times, side="left")
+    first[:1] = 0
+
+    starts = np.maximum.accumulate(first - entries) + entries
+
+    return starts[starts < steps]
+
+
+class InputCycle:
+    """This class stores the energy input per step over one repeating cycle
+    of the simulation, and uses prefix sums over this cycle to supply the
+    input energy over any range of steps in constant time."""
+    
+    def __init__(self, p_in_step, dt):
+        
+        # Energy input per step in [J], from p_in in [mW]
+        self.e_in = p_in_step/1000*dt
+        self.length = len(self.e_in)
+        
+        self.cum = np.concatenate(([0.], np.cumsum(self.e_in)))
+        self.total = self.cum[-1]
+        
+        # Largest number of steps that is looked at in one go
+        self.window_size = self.length
+    
+    def energy(self, steps):
+        """Cumulative input energy in [J] before each of the given steps."""
+        cycles, offset = np.divmod(steps, self.length)
+        return cycles*self.total + self.cum[offset]
+    
+    def window(self, start, stop):
+        """Cumulative input energy in [J] after each step in [start, stop),
+        relative to the start. The window may not cross a cycle boundary."""
+        offset = start % self.length
+        return self.cum[offset+1:offset+1+stop-start] - self.cum[offset]
+    
+    def next_step(self, start, stop, condition):
+        """First step in [start, stop) for which condition(e_in) holds,
+        or stop if there is none. The steps are looked at window_size at a
+        time, and no further than one cycle, after which they repeat."""
+        pos = start
+        
+        while pos < min(stop, start + self.length):
+            offset = pos % self.length
+            size = min(self.window_size, self.length - offset, stop - pos)
+            
+            hits = np.flatnonzero(condition(self.e_in[offset:offset+size]))
+            if len(hits) > 0:
+                return pos + hits[0]
+            pos += size
+        
+        return stop
+
+
+def input_cycle(p_in_profile, dt, steps, input_mode="sample"):
+    """
+    Parameters
+    ----------
+    p_in_profile : ndarray
+        Input power over one orbit in [mW], sampled once per second.
+    dt : double
+        Timestep in [s].
+    steps : int
+        Total number of steps in the simulation.
+    input_mode : str, optional
+        How the input power of each step is found, see sample_input().
+
+    Returns
+    -------
+    InputCycle
+        Input energy per step over the shortest run of steps that repeats
+        exactly, which is the number of steps after which the step grid
+        lines up with the orbit again, or the whole simulation if that is
+        shorter. This needs a clock of exact multiples of dt (see
+        exact_clock()). For other timesteps, the whole simulation is used
+        as a single cycle, so that its cost grows with the number of steps.
+
+    """
+    if exact_clock(dt, steps):
+        # Smallest number of steps that is a whole number of orbits
+        numerator, denominator = float(dt).as_integer_ratio()
+        length = denominator*len(p_in_profile) \
+            // math.gcd(abs(numerator), len(p_in_profile))
+        t = np.arange(min(length, max(steps, 1))) * dt
+    else:
+        t = clock(steps, dt)
+    
+    p_in_step = sample_input(p_in_profile, t, dt, input_mode)
+    
+    cycle = InputCycle(p_in_step, dt)
+    # Without a repeating cycle, look at no more than about one orbit at a
+    #   time, so that a clamp never costs more than an orbit's worth of work.
+    cycle.window_size = min(cycle.length, \
+                            max(int(len(p_in_profile)/dt), 1))
+    
+    return cycle
+
+
+def integrate_segments(battery, starts, p_out, cycle, steps, dt, batt_cap):
+    """
+    Parameters
+    ----------
+    battery : double
+        Battery charge just before the first segment in [J].
+    starts : ndarray
+        First step of each segment, as given by segment_starts(). This may
+        also be any run of consecutive segments from it.
+    p_out : ndarray
+        Constant output power in [mW] during each segment.
+    cycle : InputCycle
+        Input energy per step, as given by input_cycle().
+    steps : int
+        Total number of steps in the simulation.
+    dt : double
+        Timestep in [s].
+    batt_cap : double
+        Battery capacity in [J].
+
+    Returns
+    -------
+    segments : list of dict
+        Battery statistics of each segment.
+    pieces : list of tuple
+        (start, stop, battery, clamp) for every run of steps in which the
+        battery is either unclamped (clamp=0), full (clamp=1) or empty
+        (clamp=-1). battery is the charge just before step start.
+
+    Between schedule switches the output power is constant, so the battery
+    follows the prefix sums of the input energy exactly until it touches 0
+    or batt_cap. Whole orbits without such a clamp are skipped in one go,
+    and only the cycles in which a clamp occurs are looked at step by step,
+    with array operations over at most one cycle. The result agrees with
+    integrate_battery() to within floating-point rounding.
+
+    """
+    stops = np.append(starts[1:], steps)
+    
+    segments = []
+    pieces = []
+    piece_start = starts[0]
+    piece_battery = battery
+    
+    for start, stop, p_seg in zip(starts, stops, p_out):
+        
+        e_out = p_seg/1000*dt
+        cycle_net = cycle.total - e_out*cycle.length
+        offsets = None
+        
+        # The extremes are taken over the steps of the segment only, like
+        #   in integrate_battery() and Mission.summarize()
+        segment = {"battery_start" : battery,
+                   "battery_min" : np.inf,
+                   "battery_max" : -np.inf,
+                   "steps_full" : 0,
+                   "steps_empty" : 0}
+        
+        pos = start
+        while pos < stop:
+            
+            # ==== Skip whole cycles without clamps ====
+            full_cycles = (stop-pos) // cycle.length \
+                if pos % cycle.length == 0 else 0
+            if full_cycles > 0:
+                if offsets is None:
+                    # Trajectory offsets over a full cycle, relative to its
+                    #   start, only needed for segments of whole cycles
+                    offsets = cycle.cum[1:] \
+                        - e_out*np.arange(1, cycle.length+1)
+                safe = _safe_cycles(battery, offsets.max(), offsets.min(), \
+                                    cycle_net, batt_cap, full_cycles)
+                if safe > 0:
+                    last = battery + (safe-1)*cycle_net
+                    segment["battery_min"] = min(segment["battery_min"], \
+                        battery + offsets.min(), last + offsets.min())
+                    segment["battery_max"] = max(segment["battery_max"], \
+                        battery + offsets.max(), last + offsets.max())
+                    battery += safe*cycle_net
+                    pos += safe*cycle.length
+                    continue
+            
+            # ==== Look at the rest of this cycle ====
+            window_stop = min(stop, (pos//cycle.length + 1)*cycle.length, \
+                              pos + cycle.window_size)
+            levels = battery + cycle.window(pos, window_stop) \
+                - e_out*np.arange(1, window_stop-pos+1)
+            out_of_bounds = np.flatnonzero((levels > batt_cap) | (levels < 0))
+            
+            if len(out_of_bounds) == 0:
+                segment["battery_min"] = min(segment["battery_min"], \
+                                             levels.min())
+                segment["battery_max"] = max(segment["battery_max"], \
+                                             levels.max())
+                battery = levels[-1]
+                pos = window_stop
+                continue
+            
+            # ==== Clamp ====
+            clamp_step = pos + out_of_bounds[0]
+            if out_of_bounds[0] > 0:
+                segment["battery_min"] = min(segment["battery_min"], \
+                    levels[:out_of_bounds[0]].min())
+                segment["battery_max"] = max(segment["battery_max"], \
+                    levels[:out_of_bounds[0]].max())
+            
+            if levels[out_of_bounds[0]] > batt_cap:
+                # The battery stays full until the input drops below the
+                #   output power.
+                clamp, battery = 1, batt_cap
+                pos = cycle.next_step(clamp_step+1, stop, \
+                                      lambda e_in: e_in < e_out)
+                segment["steps_full"] += pos - clamp_step
+            else:
+                # The battery stays empty until the input exceeds the
+                #   output power.
+                clamp, battery = -1, 0.
+                pos = cycle.next_step(clamp_step+1, stop, \
+                                      lambda e_in: e_in > e_out)
+                segment["steps_empty"] += pos - clamp_step
+            
+            segment["battery_min"] = min(segment["battery_min"], battery)
+            segment["battery_max"] = max(segment["battery_max"], battery)
+            
+            if clamp_step > piece_start:
+                pieces.append((piece_start, clamp_step, piece_battery, 0))
+            pieces.append((clamp_step, pos, battery, clamp))
+            piece_start, piece_battery = pos, battery
+        
+        segment["battery_end"] = battery
+        segments.append(segment)
+    
+    if steps > piece_start:
+        pieces.append((piece_start, steps, piece_battery, 0))
+    
+    return segments, pieces
+
+
+def _safe_cycles(battery, offset_max, offset_min, cycle_net, batt_cap, \
+                 full_cycles):
+    """Number of whole cycles, up to full_cycles, that can be taken from the
+    given battery charge without touching 0 or batt_cap."""
+    
+    if battery + offset_max > batt_cap or battery + offset_min < 0:
+        return 0
+    
+    if cycle_net > 0:
+        safe = int((batt_cap - battery - offset_max) // cycle_net) + 1
+    elif cycle_net < 0:
+        safe = int((battery + offset_min) // -cycle_net) + 1
+    else:
+        safe = full_cycles
+    
+    # Leave the last cycle before a clamp to the step-wise check, so that
+    #   rounding in the division above can never skip past a clamp.
+    return max(min(safe-1, full_cycles), 0)
+
+
+def fill_battery(pieces, starts, p_out, cycle, steps, dt):
+    """
+    Parameters
+    ----------
+    pieces : list of tuple
+        Runs of steps as given by integrate_segments().
+    starts : ndarray
+        First step of each segment, as given by segment_starts().
+    p_out : ndarray
+        Constant output power in [mW] during each segment.
+    cycle : InputCycle
+        Input energy per step, as given by input_cycle().
+    steps : int
+        Total number of steps in the simulation.
+    dt : double
+        Timestep in [s].
+
+    Returns
+    -------
+    ndarray
+        Battery charge in [J] at the end of every step from the start of the
+        first segment onwards.
+
+    """
+    first = starts[0]
+    
+    # Cumulative output energy before each step
+    e_out_step = np.repeat(p_out/1000*dt, np.diff(np.append(starts, steps)))
+    out_cum = np.concatenate(([0.], np.cumsum(e_out_step)))
+    
+    battery = np.empty(steps-first)
+    for start, stop, level, clamp in pieces:
+        if clamp == 0:
+            k = np.arange(start+1, stop+1)
+            battery[start-first:stop-first] = level \
+                + cycle.energy(k) - cycle.energy(start) \
+                - (out_cum[k-first] - out_cum[start-first])
+        else:
+            battery[start-first:stop-first] = level
+    
+    return battery
+
+
+def eclipse_transitions(p_in_profile, tsim):
+    """
+    Parameters
+    ----------
+    p_in_profile : ndarray
+        Input power over one orbit, sampled once per second.
+    tsim : double
+        Total simulation length in [s].
+
+    Returns
+    -------
+    ndarray
+        Times in [s] up to tsim at which the satellite enters or leaves
+        eclipse, i.e. where the input power switches between zero and
+        non-zero, repeated for every orbit.
+
+    """
+    sun = p_in_profile != 0
+    edges = np.flatnonzero(sun != np.roll(sun, 1))
+
+    orbits = np.arange(int(tsim // len(p_in_profile)) + 1)
+    times = (orbits[:, None]*len(p_in_profile) + edges[None, :]).ravel()
+
+    return times[times <= tsim]
+
+
+def adaptive_timeline(tsim, breakpoints, refine, dt_min, dt_max):
+    """
+    Parameters
+    ----------
+    tsim : double
+        Total simulation length in [s].
+    breakpoints : ndarray
+        Times in [s] that must be landed on exactly.
+    refine : ndarray
+        Intervals in [s], with shape (intervals, 2), in which steps may be
+        no longer than dt_min.
+    dt_min : double
+        Largest step in [s] within the refine intervals.
+    dt_max : double
+        Largest step in [s] everywhere else.
+
+    Returns
+    -------
+    t : ndarray
+        Start time of each step in [s].
+    dt : ndarray
+        Length of each step in [s]. The last step ends exactly at tsim.
+
+    Every stretch between two consecutive breakpoints or refine interval
+    edges is split into equal steps, as long as allowed.
+
+    """
+    refine = np.clip(np.asarray(refine, dtype=float).reshape(-1, 2), 0, tsim)
+
+    knots = np.unique(np.concatenate(([0., tsim], \
+        np.clip(np.asarray(breakpoints, dtype=float), 0, tsim), \
+        refine.ravel())))
+    lengths = np.diff(knots)
+
+    # Stretches whose middle lies in a refine interval get small steps
+    middles = knots[:-1] + lengths/2
+    opened = np.searchsorted(np.sort(refine[:, 0]), middles, side="right")
+    closed = np.searchsorted(np.sort(refine[:, 1]), middles, side="right")
+    refined = opened > closed
+
+    counts = np.ceil(np.round(lengths/np.where(refined, dt_min, dt_max), \
+                              9)).astype(int)
+    counts = np.maximum(counts, 1)
+
+    stretch = np.repeat(np.arange(len(lengths)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts)-counts, \
+                                                 counts)
+
+    dt = lengths[stretch]/counts[stretch]
+    t = knots[stretch] + within*dt
+
+    return t, dt
+
+
+def input_range(p_in_profile, t, dt):
+    """
+    Parameters
+    ----------
+    p_in_profile : ndarray
+        Input power over one orbit, sampled once per second.
+    t : ndarray
+        Start time of each step in [s].
+    dt : ndarray
+        Length of each step in [s].
+
+    Returns
+    -------
+    lowest : ndarray
+        Lowest input power during each step, in the same unit as
+        p_in_profile.
+    highest : ndarray
+        Highest input power during each step.
+
+    """
+    length = len(p_in_profile)
+
+    first = np.floor(t).astype(int)
+    count = np.maximum(np.ceil(t+dt).astype(int) - first, 1)
+
+    # Sparse table of the extremes over runs of 2**level seconds, on two
+    #   orbits back to back so that runs can wrap past the end of an orbit.
+    levels_max = [np.tile(p_in_profile, 2)]
+    levels_min = [levels_max[0]]
+    while 2**len(levels_max) <= min(count.max(initial=1), length):
+        half = 2**(len(levels_max)-1)
+        levels_max.append(np.maximum(levels_max[-1][:-half], \
+                                     levels_max[-1][half:]))
+        levels_min.append(np.minimum(levels_min[-1][:-half], \
+                                     levels_min[-1][half:]))
+
+    lowest = np.full(len(t), p_in_profile.min())
+    highest = np.full(len(t), p_in_profile.max())
+
+    short = count <= length
+    start = first[short] % length
+    level = np.floor(np.log2(count[short])).astype(int)
+    end = start + count[short] - 2**level
+
+    for i in np.unique(level):
+        pick = np.flatnonzero(short)[level == i]
+        lowest[pick] = np.minimum(levels_min[i][start[level == i]], \
+                                  levels_min[i][end[level == i]])
+        highest[pick] = np.maximum(levels_max[i][start[level == i]], \
+                                   levels_max[i][end[level == i]])
+
+    return lowest, highest
+
+
+def decimate(values, bins):
+    """
+    Parameters
+    ----------
+    values : ndarray
+        Samples of a line to be plotted.
+    bins : int
+        Number of bins to keep samples for, e.g. the width of the plot in
+        pixels.
+
+    Returns
+    -------
+    ndarray
+        Sorted indices of the samples to plot. The samples are split into
+        bins of equal length, and of each bin, only the first, last, lowest
+        and highest sample are kept. Drawn at a resolution of one bin per
+        pixel, the line then looks the same as with all samples, while the
+        number of samples drawn no longer depends on the length of the
+        simulation.
+
+    """
+    values = np.asarray(values)
+    n = len(values)
+
+    if n <= 4*bins:
+        return np.arange(n)
+
+    size = -(-n // bins)
+    count = -(-n // size)
+
+    # Pad the last bin with its last sample to split the samples evenly
+    rows = np.concatenate((values, np.full(count*size-n, values[-1]))) \
+        .reshape(count, size)
+
+    first = np.arange(count)*size
+    picks = np.column_stack((first, first + rows.argmin(axis=1), \
+                             first + rows.argmax(axis=1), first + size-1))
+
+    return np.unique(np.minimum(picks, n-1))
+
+
+def runs(values):
+    """
+    Parameters
+    ----------
+    values : ndarray
+        Values at each step.
+
+    Returns
+    -------
+    ndarray
+        Index of the first step of every run of equal values.
+
+    """
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.zeros(0, dtype=int)
+    return np.append(0, np.flatnonzero(values[1:] != values[:-1]) + 1)
+
+
+def exceedances(values, limits):
+    """
+    Parameters
+    ----------
+    values : ndarray
+        Values at each step, with shape (steps, columns).
+    limits : ndarray
+        Limit of each column, with shape (columns,). A limit of NaN is never
+        exceeded.
+
+    Returns
+    -------
+    columns : ndarray
+        Column of every interval of consecutive steps in which the values
+        exceed the limit of their column. The intervals of all columns are
+        found at once, ordered by column and then by step.
+    starts : ndarray
+        First step of every interval.
+    ends : ndarray
+        Step after the last step of every interval.
+    peaks : ndarray
+        Highest value within every interval.
+
+    """
+    values = np.asarray(values, dtype=float)
+    steps, columns = values.shape
+
+    # One row per column, with a step below the limit on either side, so
+    #   that no interval runs on from one column into the next.
+    padded = np.full((columns, steps+2), -np.inf)
+    padded[:, 1:-1] = values.T
+    over = (padded > np.asarray(limits, dtype=float)[:, None]).ravel()
+
+    edges = np.flatnonzero(over[1:] != over[:-1]) + 1
+    starts, ends = edges[0::2], edges[1::2]
+    if len(starts) == 0:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), \
+            np.zeros(0, dtype=int), np.zeros(0)
+
+    peaks = np.maximum.reduceat(padded.ravel(), edges)[0::2]
+    column, start = np.divmod(starts, steps+2)
+    return column, start-1, ends - column*(steps+2) - 1, peaks
@@ -9,9 +9,9 @@ example2.py
 
 #%% Import packages
 import numpy as np
-import pandas as pd
 
 from mission import Mission
+from loader import load_power_frame
 
 #%% Defining the inputs
 
@@ -25,9 +25,10 @@ config = {
     
     "panel_degradation_factor" : 0.02,
     
-    "blip_period" : 30, # Currently unused, telemetry blip period
-    "blip_duration" : 1, # Currently unused, telemetry blip duration
-    "no_blips" : ["downlink"], # Currently unused
+    "blip_period" : 30, # Telemetry blip period [s]
+    "blip_duration" : 1, # Telemetry blip duration [s]
+    "blip_power" : 0, # Power of a telemetry blip [mW], 0 for no blips
+    "no_blips" : ["downlink"], # OpStates without telemetry blips
     
     "orbital_altitude" : 550 # Orbital altitude in [km]
     }
@@ -98,7 +99,7 @@ schedule2 = {
     }
 
 # Loading the power frame, or the device/OpState table
-power_frame = pd.read_excel('power.xlsx',index_col=0)
+power_frame = load_power_frame('power.xlsx')
 
 # Loading the two power input vectors, generated by CubeSat-Solar-Estimator
 p_sun = np.load("P_sun.npy")
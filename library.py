@@ -0,0 +1,131 @@
+"""
+library.py
+
+"Specification of the ProfileLibrary class, which holds a different input
+    power profile for every day or week of a long simulation, in a single
+    memory-mapped array."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import os
+
+import numpy as np
+
+
+def index_path(path):
+    """Returns the path of the index of a profile library, e.g.
+    seasons.index.npy for seasons.npy."""
+    return os.path.splitext(path)[0] + ".index.npy"
+
+
+def declination(day):
+    """Returns the approximate declination of the Sun in [deg] on the given
+    day of the year, counting from 0 on January 1st."""
+    return 23.44*np.sin(2*np.pi*(np.asarray(day, dtype=float) - 80)/365.25)
+
+
+def save_profile_library(path, profiles, starts):
+    """Stores a profile library as an npy file of profiles at path, and an
+    npy file of start times in [s] next to it (see index_path())."""
+    np.save(path, np.asarray(profiles, dtype=float))
+    np.save(index_path(path), np.asarray(starts, dtype=float))
+
+
+class ProfileLibrary:
+    """This class stores input power profiles of one orbit each, as an array
+    with shape (profiles, samples), along with the time in [s] from which
+    each profile holds. Like the sum of p_sun and p_alb, each profile holds
+    the total input power in [W] over one orbit, starting closest to the
+    Sun, with any number of samples.
+
+    The profiles are usually a memory map of an npy file (see load()), so
+    that only the profiles a simulation gets to are read from disk."""
+
+    def __init__(self, profiles, starts):
+        starts = np.asarray(starts, dtype=float)
+
+        if np.ndim(profiles) != 2:
+            raise ValueError("The profiles of a ProfileLibrary must have \
+                             shape (profiles, samples)!")
+        if len(starts) != len(profiles):
+            raise ValueError("A ProfileLibrary needs one start time per \
+                             profile! ({} start times for {} profiles)" \
+                             .format(len(starts), len(profiles)))
+        if np.any(np.diff(starts) < 0):
+            raise ValueError("The start times of a ProfileLibrary must be \
+                             sorted!")
+
+        self.profiles = profiles
+        self.starts = starts
+
+    def __getstate__(self):
+        # A memory map is sent to other processes as its file, rather than
+        #   as a copy of all its profiles.
+        if isinstance(self.profiles, np.memmap) and self.profiles.filename:
+            return {"path" : self.profiles.filename, "starts" : self.starts}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if "path" in state:
+            state = {"profiles" : np.load(state["path"], mmap_mode="r"),
+                     "starts" : state["starts"]}
+        self.__dict__.update(state)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    @classmethod
+    def load(cls, path, interval=None):
+        """Opens the profile library stored at path as a memory map. The
+        start times are read from its index (see index_path()), or, if
+        interval is given, the profiles are taken to follow each other
+        every interval seconds instead."""
+        profiles = np.load(path, mmap_mode="r")
+
+        if interval is not None:
+            starts = np.arange(len(profiles))*interval
+        else:
+            starts = np.load(index_path(path))
+
+        return cls(profiles, starts)
+
+    @classmethod
+    def generate(cls, path, orbit, count, interval=86400, samples=500, \
+                 sun_power=1., panels=None, albedo_power=0., first_day=0, \
+                 block=64):
+        """Generates count profiles, following each other every interval
+        seconds, from the analytic profiles of orbit (see
+        Orbit.sun_profile() and Orbit.albedo_profile()) at the declination
+        of the Sun at the start of each. first_day is the day of the year at
+        which the first profile starts.
+
+        The profiles are written to path a block at a time, so that
+        the whole library is never held in memory, and the library is
+        returned as a memory map of the file."""
+
+        profiles = np.lib.format.open_memmap(path, mode="w+", dtype=float, \
+                                             shape=(count, samples))
+        for start in range(0, count, block):
+            day = first_day + np.arange(start, min(start+block, count)) \
+                * interval/86400
+            profiles[start:start+len(day)] = \
+                orbit.sun_profile(samples, sun_power, panels, \
+                                  declination(day)) \
+                + orbit.albedo_profile(samples, albedo_power, \
+                                       declination(day))
+        profiles.flush()
+        del profiles
+
+        np.save(index_path(path), np.arange(count)*float(interval))
+        return cls.load(path)
+
+    def rows(self, times):
+        """Returns the profile that holds at each of the given times in [s].
+        Times before the first start time use the first profile."""
+        return np.maximum(np.searchsorted(self.starts, times, \
+                                          side="right") - 1, 0)
+
+    def profile(self, row):
+        """Returns a single profile, read into memory."""
+        return np.array(self.profiles[row], dtype=float)
@@ -0,0 +1,90 @@
+"""
+loader.py
+
+"Loads the power frame from power.xlsx, through a binary cache that is far
+    quicker to read than the spreadsheet itself."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def file_hash(path):
+    """Returns the BLAKE2b hash of the contents of a file."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(path):
+    """Returns the path of the cache of a spreadsheet, e.g. power.cache.npz
+    for power.xlsx."""
+    return os.path.splitext(path)[0] + ".cache.npz"
+
+
+def load_power_frame(path="power.xlsx", cache=None):
+    """Returns the power frame stored in the spreadsheet at path, with the
+    devices as index and the OpStates as columns, like
+    pd.read_excel(path, index_col=0).
+
+    The first time, the spreadsheet is parsed and its values, devices and
+    OpStates are written to the npz file cache (see cache_path() by
+    default). After that, the cache is read instead, for as long as the
+    spreadsheet keeps the same modification time and size. If these have
+    changed, the cache is still used if the contents of the spreadsheet
+    hash the same, and rebuilt otherwise."""
+
+    if cache is None:
+        cache = cache_path(path)
+
+    stat = os.stat(path)
+    digest = None
+
+    if os.path.exists(cache):
+        with np.load(cache, allow_pickle=False) as stored:
+            stored = dict(stored)
+
+        if stored["mtime_ns"] == stat.st_mtime_ns \
+                and stored["size"] == stat.st_size:
+            return frame(stored)
+
+        digest = file_hash(path)
+        if str(stored["hash"]) == digest:
+            write_cache(cache, stored, stat, digest)
+            return frame(stored)
+
+    power_frame = pd.read_excel(path, index_col=0)
+
+    stored = {"values" : power_frame.to_numpy(),
+              "index" : power_frame.index.to_numpy(dtype=str),
+              "columns" : power_frame.columns.to_numpy(dtype=str)}
+    write_cache(cache, stored, stat, digest or file_hash(path))
+
+    return power_frame
+
+
+def frame(stored):
+    """Builds the power frame from the arrays stored in its cache."""
+    return pd.DataFrame(stored["values"], index=list(stored["index"]), \
+                        columns=list(stored["columns"]))
+
+
+def write_cache(cache, stored, stat, digest):
+    """Writes the arrays of the power frame to its cache, along with the
+    modification time, size and hash of the spreadsheet they came from."""
+
+    # Write to a temporary file first, so that worker processes starting up
+    #   at the same time never read a half-written cache.
+    temporary = "{}.{}.tmp.npz".format(os.path.splitext(cache)[0], \
+                                       os.getpid())
+    np.savez(temporary, values=stored["values"], index=stored["index"], \
+             columns=stored["columns"], mtime_ns=stat.st_mtime_ns, \
+             size=stat.st_size, hash=digest)
+    os.replace(temporary, cache)
@@ -11,6 +11,7 @@ import time
 from orbit import Orbit
 from opstate import OpState
 from mission import Mission
+from loader import load_power_frame
 
 
 config = {
@@ -122,7 +123,7 @@ state_colours = {
     "detumbling_mode"   : "#ff00ff"
     }
 
-power_frame = pd.read_excel('power.xlsx',index_col=0)
+power_frame = load_power_frame('power.xlsx')
 
 p_sun = np.load("P_sun.npy")
 p_alb = np.load("P_alb.npy")
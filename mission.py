@@ -8,17 +8,25 @@ mission.py
 
 #%%###### PACKAGE LOGISTICS #########
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.collections as collections
-import time
+import contextlib
+import hashlib
 import pandas as pd
 
+import engine
 from orbit import Orbit
 from opstate import OpState
+from profiler import Profiler
+from schedule import Schedule, PeriodicSchedule
+from simresult import SimResult
 
     
 class Mission:
     
+    # Config values that can be varied by Mission.sweep()
+    sweep_parameters = ("years_passed", "battery_capacity", \
+                        "battery_degradation_factor", "battery_init", \
+                        "panel_degradation_factor", "orbital_altitude")
+    
     def __init__(self, config, device_channels, state_list, \
                  channels, power_frame, p_sun, p_alb):
         
@@ -27,6 +35,11 @@ class Mission:
         self.state_list = state_list
         self.channels = channels
         
+        self.power_frame = power_frame
+        
+        # Check internal coherence of given inputs
+        self.check_coherence(power_frame, p_sun, p_alb)
+        
         self.opstates = self.make_opstates(power_frame, config["no_blips"])
 
         self.batt_cap = config["battery_capacity"] * \
@@ -36,18 +49,40 @@ class Mission:
         
         self.blip_period = config["blip_period"]
         self.blip_duration = config["blip_duration"]
+        # Power of a telemetry blip in [mW], see Mission.output_power()
+        self.blip_power = config.get("blip_power", 0)
         
         self.orbital_altitude = config["orbital_altitude"]
+        self.inclination = config.get("inclination", 97.5)
+        self.ltan = config.get("ltan", 10.5)
         
         self.dt = None
         self.tsim = None
         self.schedule = None
+        self.mode = None
+        self.input_mode = "sample"
+        self.compact = False
+        self.segment_data = None
+        self.checkpoints = None
         
         self.p_sun = p_sun
         self.p_alb = p_alb
-        
-        # Check internal coherence of given inputs
-        self.check_coherence(power_frame)
+        # Running statistics of the last propagate_stats()
+        self.stats = None
+        # Battery limit cycle of the last limit_cycle()
+        self.steady_state = None
+        # Profile per stretch of time, see Mission.use_profile_library()
+        self.profile_library = None
+        
+        # Cache of input power profiles, see Mission.power_input()
+        self.input_cache = {}
+        self.input_cache_size = 64
+        
+        # Profiling of propagations, see Mission.add_metrics_sink()
+        self.verbose = True
+        self.metrics_sinks = []
+        self.profiler = None
+        self.last_profile = None
         
         # Initialize simulation dataframe:
         self.datacols = ["t"] + ["OpState"] + ["p_in", "p_out"] + ["sun"] + \
@@ -56,16 +91,49 @@ class Mission:
         
     def reset_sim_data(self):
         self.sim_data = pd.DataFrame(columns = self.datacols)
+        self.step_report = None
+        self.cycle_data = None
+        self.segment_data = None
     
-    def check_coherence(self, power_frame):
-        # TODO
-        # Check that power_frame does not contain states not in state_list
-        # Check that power_frame does not contain devices not in devices
-        # Check that device and device_channels have same number of devices
-        # Check that device_channels contains no channels not in channels
-    
+    def check_coherence(self, power_frame, p_sun, p_alb):
+        """Raises a ValueError if the inputs cannot be simulated together,
+        and warns about inputs that are ignored or look suspect."""
+        
+        # Every OpState needs a column in power_frame
+        missing = pd.Index(self.state_list).difference(power_frame.columns)
+        if len(missing) > 0:
+            raise ValueError("OpStates {} are not in the power frame!" \
+                             .format(list(missing)))
+        
+        # Every device must be on a known channel
+        channels = pd.Index(list(self.device_channels.values()))
+        unknown = channels.difference(self.channels)
+        if len(unknown) > 0:
+            raise ValueError("device_channels contains channels {} that are \
+                             not in channels!".format(list(unknown)))
+        
+        ignored_states = power_frame.columns.difference(self.state_list)
+        if len(ignored_states) > 0:
+            print("\x1b[31mWarning: Power frame contains OpStates that are", \
+                  "not in state_list, which are ignored:", \
+                  list(ignored_states), "\x1b[0m")
+        
+        devices = pd.Index(list(self.device_channels.keys()))
+        ignored_devices = power_frame.index.difference(devices)
+        if len(ignored_devices) > 0:
+            print("\x1b[31mWarning: Power frame contains devices that are", \
+                  "not in device_channels, which are ignored, also in the", \
+                  "total output power:", list(ignored_devices), "\x1b[0m")
+        unpowered = devices.difference(power_frame.index)
+        if len(unpowered) > 0:
+            print("\x1b[31mWarning: Devices", list(unpowered), "are not in", \
+                  "the power frame, and are taken to use no power. \x1b[0m")
+        
         # Check if p_sun and p_alb have zeros (if not, no shadow!)
-        pass
+        for name, p in (("p_sun", p_sun), ("p_alb", p_alb)):
+            if np.all(np.asarray(p) != 0):
+                print("\x1b[31mWarning:", name, "has no zeros, so the", \
+                      "satellite is never in eclipse! \x1b[0m")
         
     def make_opstates(self, power_frame, no_blips):
         opstates = {}
@@ -77,148 +145,1302 @@ class Mission:
             else:                
                 opstates[opstate] = OpState(power_frame[opstate].to_dict(), \
                                        self.channels, self.device_channels)
+        
+        self.compile_opstates(power_frame, opstates)
         return opstates
+    
+    def compile_opstates(self, power_frame, opstates):
+        """Compiles the power frame into tables indexed by OpState, in the
+        order of state_list: state_device, device_channel, state_channel,
+        state_power (all in [mW]) and state_blips."""
+        devices = list(self.device_channels.keys())
         
-    def propagate(self, schedule_unsorted, tsim=10, dt=1):
-        self.reset_sim_data()
+        # Devices missing from the power frame use no power
+        self.state_device = power_frame.reindex(devices, fill_value=0) \
+            [self.state_list].to_numpy(dtype=float).T
+        
+        self.device_channel = np.zeros((len(devices), len(self.channels)))
+        for i, device in enumerate(devices):
+            self.device_channel[i, \
+                self.channels.index(self.device_channels[device])] = 1
+        
+        self.state_channel = self.state_device @ self.device_channel
+        # Added up one device at a time in the order of the power frame, like
+        #   OpState.power_used(), but without the devices that are not in
+        #   device_channels, see check_coherence()
+        powered = power_frame.loc[power_frame.index.isin(devices), \
+                                  self.state_list].to_numpy(dtype=float)
+        self.state_power = np.cumsum(powered, axis=0)[-1] \
+            if len(powered) > 0 else np.zeros(len(self.state_list))
+        self.state_blips = np.array([opstates[opstate].blips() \
+                                     for opstate in self.state_list], \
+                                    dtype=float)
+        
+    def power_input(self, orbital_altitude=None):
+        """Returns the total input power over one orbit in [W], sampled
+        once per second, cached per altitude as a read-only array."""
+        if orbital_altitude is None:
+            orbital_altitude = self.orbital_altitude
+        
+        key = (orbital_altitude,) + self.input_hashes()
+        if key not in self.input_cache:
+            self.cache_input(key, self.interpolate_input(orbital_altitude))
+        
+        return self.input_cache[key]
+    
+    def input_profile(self, orbital_altitude=None):
+        """Returns the degraded input power over one orbit in [mW], sampled
+        once per second, cached as a read-only array."""
+        if orbital_altitude is None:
+            orbital_altitude = self.orbital_altitude
+        
+        key = (orbital_altitude,) + self.input_hashes() + \
+            (self.config["years_passed"], \
+             self.config["panel_degradation_factor"])
+        if key not in self.input_cache:
+            self.cache_input(key, \
+                self.power_input(orbital_altitude)*1000*self.panel_factor())
+        
+        return self.input_cache[key]
+    
+    def input_hashes(self):
+        """Returns hashes of the contents of p_sun and p_alb."""
+        return tuple(hashlib.blake2b(np.ascontiguousarray(p).tobytes() + \
+                                     str((p.dtype, p.shape)).encode(), \
+                                     digest_size=16).hexdigest() \
+                     for p in (np.asarray(self.p_sun), np.asarray(self.p_alb)))
+    
+    def cache_input(self, key, profile):
+        # Keep the cache from growing without bounds during long sweeps
+        if len(self.input_cache) >= self.input_cache_size:
+            del self.input_cache[next(iter(self.input_cache))]
         
-        self.dt = dt
-        self.tsim = tsim
+        profile.flags.writeable = False
+        self.input_cache[key] = profile
+    
+    def orbit(self, orbital_altitude=None):
+        """Returns the Orbit of the mission, at the configured altitude
+        unless another is given."""
+        if orbital_altitude is None:
+            orbital_altitude = self.orbital_altitude
+        return Orbit(orbital_altitude, self.inclination, self.ltan)
+    
+    def interpolate_input(self, orbital_altitude):
+        """Interpolates p_sun and p_alb onto one orbit at the given altitude,
+        and returns their sum in [W], sampled once per second."""
+        t_orbit = self.orbit(orbital_altitude).period()
+        
+        with self.phase("interp"):
+            p_sun_ext = np.interp(np.linspace(1,t_orbit,t_orbit), \
+                                  np.linspace(1,t_orbit,len(self.p_sun)),\
+                                  self.p_sun)
+            p_alb_ext = np.interp(np.linspace(1,t_orbit,t_orbit), \
+                                  np.linspace(1,t_orbit,len(self.p_alb)),\
+                                  self.p_alb)
+        
+        return p_sun_ext + p_alb_ext
+    
+    def use_profile_library(self, library):
+        """Takes the input power of every orbit from a ProfileLibrary rather
+        than from p_sun and p_alb, or goes back to these if library is None.
+        Only the step-by-step propagation methods support a library."""
+        self.profile_library = library
+        
+        # Profiles cached from an earlier library no longer apply
+        self.input_cache = {key: profile for key, profile \
+                            in self.input_cache.items() \
+                            if key[0] != "library"}
+    
+    def has_blips(self):
+        return self.blip_power != 0 and bool(np.any(self.state_blips))
+    
+    def output_power(self, t, opstate_idx, dt):
+        """Returns P_out in [mW] of each of the given steps, including the
+        telemetry blips averaged over each step. The blips are not part of
+        any channel or device."""
+        p_out = self.state_power[opstate_idx]
+        
+        if self.has_blips():
+            p_out = p_out + self.blip_power*self.state_blips[opstate_idx] \
+                * engine.blip_fraction(t, dt, self.blip_period, \
+                                       self.blip_duration)
+        return p_out
+    
+    def require_constant_output(self, method):
+        if self.has_blips():
+            raise ValueError("{} needs the output power to stay the same \
+                             between schedule switches, and cannot be used \
+                             with telemetry blips! Use step mode instead." \
+                             .format(method))
+    
+    def require_fixed_input(self, method):
+        if self.profile_library is not None:
+            raise ValueError("{} needs the input power to repeat every \
+                             orbit, and cannot be used with a profile \
+                             library! Use step mode instead.".format(method))
+    
+    def library_profile(self, row, t_orbit):
+        """Returns a profile of the library in [mW] after lifetime 
+        degradation, stretched onto one orbit of t_orbit seconds. The result
+        is cached like the input profile of p_sun and p_alb."""
+        key = ("library", row, t_orbit, \
+               self.config["years_passed"], \
+               self.config["panel_degradation_factor"])
+        if key not in self.input_cache:
+            profile = self.profile_library.profile(row)
+            self.cache_input(key, np.interp(np.linspace(1,t_orbit,t_orbit), \
+                np.linspace(1,t_orbit,len(profile)), profile) \
+                * 1000*self.panel_factor())
+        return self.input_cache[key]
+    
+    def library_input(self, t, dt):
+        """Returns the input power in [mW] of each of the given steps, from
+        the profiles of the library for the orbits they lie in."""
+        if len(t) == 0:
+            return np.zeros(0)
+        
+        t_orbit = self.orbit().period()
+        first_orbit = int(min(np.round(t[0]), t[0]) // t_orbit)
+        last_orbit = int(np.max(np.maximum(np.round(t[-1]), t + dt)) \
+                         // t_orbit)
+        orbits = np.arange(first_orbit, last_orbit+1)
+        
+        rows, orbit_rows = np.unique(self.profile_library.rows( \
+            orbits*t_orbit), return_inverse=True)
+        with self.phase("library"):
+            profiles = np.stack([self.library_profile(row.item(), t_orbit) \
+                                 for row in rows])
+        
+        return engine.sample_input_orbits(profiles, orbit_rows, \
+            first_orbit, t, dt, self.input_mode)
+    
+    def panel_factor(self):
+        """Returns the fraction of input power left after degradation."""
+        return 1-self.config["years_passed"] \
+            * self.config["panel_degradation_factor"]
+    
+    def compile_schedule(self, schedule_unsorted, tsim, dt=None):
+        """Returns the schedule compiled into a Schedule, along with its
+        switch times and the OpState index of each entry. If dt is given,
+        warns about entries that follow each other too closely."""
         
-        begin = time.time()
+        schedule = Schedule.compile(schedule_unsorted, self.state_list)
         
         # Throw warning if given simulation duration does not cover the
         #   schedule completely.
-        if tsim < max(schedule_unsorted.keys()):
+        if len(schedule) > 0 and tsim < schedule.times[-1]:
             print("\x1b[31mWarning: Schedule is longer than total", \
                       "simulation length! (t_schedule =", \
-                      max(schedule_unsorted.keys()), "[s] and t_sim =", \
+                      schedule.times[-1], "[s] and t_sim =", \
                       tsim, "[s]) \x1b[0m")
-        # TODO: Check that schedule contains no states not in state_list
-        # TODO: Throw warning if smallest schedule increment is close to 
-        #   chosen dt, and advise to choose a smaller dt or remake the
-        #   schedule such that the times are perfect divisors of dt
+        
+        # Throw warning if schedule increments are close to the chosen dt
+        if dt is not None:
+            late, close = schedule.check_timestep(dt)
+            if late:
+                print("\x1b[31mWarning:", late, "schedule entries start", \
+                      "within one timestep of the previous entry, and will", \
+                      "start late. Choose a smaller dt. \x1b[0m")
+            if close:
+                print("\x1b[31mWarning:", close, "schedule entries start", \
+                      "within two timesteps of the previous entry at a time", \
+                      "that is not a multiple of dt, and may start late.", \
+                      "Choose a smaller dt, or remake the schedule such", \
+                      "that the times are multiples of dt. \x1b[0m")
+        
+        return schedule, schedule.times, schedule.states
+    
+    def add_metrics_sink(self, sink):
+        """Adds a function that is called with the profile of every run once
+        it is done, as given by Profiler.report(). The last profile is also
+        kept in self.last_profile."""
+        self.metrics_sinks.append(sink)
+    
+    def start_profile(self, method):
+        self.profiler = Profiler(method)
+    
+    def phase(self, name):
+        """Returns a context manager that times a phase of the current 
+        propagation, if any."""
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.phase(name)
+    
+    def finish_profile(self):
+        """Ends the profile of the current propagation, prints its runtime
+        if self.verbose is set, and hands it to every metrics sink."""
+        profile = self.profiler.finish()
+        self.profiler = None
+        self.last_profile = profile
+        
+        if self.verbose:
+            runtime = round(profile["total"],3)
+            print("\x1b[1;30;43m", "Runtime:", runtime, "[s]", "\x1b[0m")
+        
+        for sink in self.metrics_sinks:
+            sink(profile)
+        return profile
+    
+    @staticmethod
+    def data_bytes(data):
+        """Returns the memory used by simulation data in bytes, be it a
+        dataframe or a SimResult."""
+        if isinstance(data, SimResult):
+            return data.nbytes
+        return int(data.memory_usage(index=True).sum())
+    
+    def propagate(self, schedule_unsorted, tsim=10, dt=1, mode="step", \
+                  compact=False, input_mode="sample"):
+        """Propagates the schedule over tsim seconds in steps of dt, and
+        returns the simulation dataframe, or a SimResult if compact is set.
+        mode is "step" or "segment", input_mode "sample" or "average"."""
+        
+        if mode not in ("step", "segment"):
+            raise ValueError("Unknown propagation mode '{}'! Choose either \
+                             'step' or 'segment'.".format(mode))
+        
+        self.reset_sim_data()
+        
+        self.dt = dt
+        self.tsim = tsim
+        self.mode = mode
+        self.compact = compact
+        self.input_mode = input_mode
+        
+        if mode == "segment":
+            self.require_fixed_input("Segment mode")
+            self.require_constant_output("Segment mode")
+        self.start_profile("propagate")
         
         # Properly setting up input power:
-        t_orbit = Orbit(self.orbital_altitude,97.5,10.5).period()
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
         
-        p_sun_ext = np.interp(np.linspace(1,t_orbit,t_orbit), \
-                              np.linspace(1,t_orbit,len(self.p_sun)),\
-                              self.p_sun)
-        p_alb_ext = np.interp(np.linspace(1,t_orbit,t_orbit), \
-                              np.linspace(1,t_orbit,len(self.p_alb)),\
-                              self.p_alb)
+        with self.phase("schedule"):
+            self.schedule, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, tsim, dt)
         
-        p_in_tot = p_sun_ext + p_alb_ext
+        # Set up the timeline
+        with self.phase("steps"):
+            t = engine.timeline(self.tsim, self.dt)
+            
+            entry_idx, opstate_idx, p_in, p_out = \
+                self.step_arrays(t, p_in_profile, switch_times, entry_states)
+        
+        # ==== Current battery level ====
+        with self.phase("integration"):
+            if mode == "step":
+                battery = engine.integrate_battery(self.batt_init, \
+                                                   (p_in - p_out)/1000*dt, \
+                                                   self.batt_cap)
+                # /1000 'cause mW -> W
+            else:
+                battery = self.integrate_segments(p_in_profile, \
+                    switch_times, entry_states, len(t))
+        
+        # ==== Assemble the simulation data in one go ====
+        with self.phase("assembly"):
+            self.sim_data = self.build_sim_data(t, opstate_idx, p_in, \
+                                                p_out, battery, compact)
+            self.checkpoints = self.make_checkpoints(t, entry_idx, \
+                opstate_idx, battery, self.batt_init)
+        
+        self.profiler.count("steps", len(t))
+        self.profiler.memory(self.data_bytes(self.sim_data))
+        self.finish_profile()
+        return self.sim_data
     
-        # Make schedule iterable by making list of tuples
-        schedule = []
-        [schedule.append(item) for item in sorted(schedule_unsorted.items())]
-        # tuple([(t_i, schedule[t_i]) for t_i in schedule.keys()])
+    def step_arrays(self, t, p_in_profile, switch_times, entry_states, \
+                    entry=0):
+        """Returns the schedule entry, OpState index, P_in and P_out of each
+        of the given steps. entry is the schedule entry that is active just
+        before the first of these steps."""
+        
+        # ==== Currently scheduled operation ====
+        # Look up the schedule entry and thereby the OpState of every step
+        entry_idx = engine.schedule_index(t, switch_times, entry)
+        opstate_idx = entry_states[entry_idx]
+        
+        # ==== Current total P_in ====
+        # Lifetime degradation is already part of the input profile
+        if self.profile_library is None:
+            p_in = engine.sample_input(p_in_profile, t, self.dt, \
+                                       self.input_mode)
+        else:
+            p_in = self.library_input(t, self.dt)
+        
+        # ==== Current total P_out ====
+        p_out = self.output_power(t, opstate_idx, self.dt)
         
+        return entry_idx, opstate_idx, p_in, p_out
+    
+    def make_checkpoints(self, t, entry_idx, opstate_idx, battery, \
+                         battery_before, entry_before=-1, first_step=0):
+        """Returns the step, time, OpState and battery charge at the start of
+        every schedule segment in the given run of steps."""
+        
+        starts = np.flatnonzero(np.diff(entry_idx, prepend=entry_before))
+        battery_start = np.append(battery_before, battery)[starts]
+        
+        return pd.DataFrame({"step" : starts + first_step, \
+                             "t" : t[starts], \
+                             "OpState" : np.array(list(self.opstates.keys()),\
+                                 dtype=object)[opstate_idx[starts]], \
+                             "battery" : battery_start})
+    
+    def repropagate(self, schedule_unsorted):
+        """Propagates an edited version of the last schedule, and returns the
+        simulation dataframe. Only the steps from the earliest change on are
+        simulated again, starting from the checkpoints of the last run."""
+        
+        if self.checkpoints is None:
+            raise RuntimeError("Nothing to re-propagate! Please run the \
+                               .propagate() method before continuing!")
+        if self.mode not in ("step", "segment"):
+            raise ValueError("Only runs of .propagate() can be re-propagated, \
+                             and the last run was in {} mode! Please run it \
+                             again with the new schedule instead." \
+                             .format(self.mode))
+        
+        self.start_profile("repropagate")
+        
+        with self.phase("schedule"):
+            schedule, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, self.tsim, \
+                                      self.dt)
+        
+        # ==== Find the earliest change in the schedule ====
+        first = schedule.first_difference(self.schedule)
+        
+        if first == len(schedule) == len(self.schedule):
+            self.profiler.count("steps", 0)
+            self.finish_profile()
+            return self.sim_data
+        
+        t_change = min([entries.times[first] for entries \
+                        in (schedule, self.schedule) if first < len(entries)])
+        
+        t = np.asarray(self.sim_data["t"])
+        step = int(np.searchsorted(t, t_change, side="left"))
+        
+        # ==== Pick up the last run at the closest checkpoint ====
+        checkpoint_steps = self.checkpoints["step"].to_numpy()
+        if self.mode == "segment" and step > 0:
+            segment = np.searchsorted(checkpoint_steps, step-1, side="right")
+            step = int(checkpoint_steps[segment-1])
+        
+        if step == 0:
+            # Nothing to keep, so this is profiled as a full propagation
+            return self.propagate(schedule_unsorted, self.tsim, self.dt, \
+                                  self.mode, self.compact, self.input_mode)
+        
+        # Schedule entry and battery charge just before the change
+        entry_before = int(np.searchsorted(checkpoint_steps, step-1, \
+                                           side="right")) - 1
+        battery_before = np.asarray(self.sim_data["battery"])[step-1]
+        
+        # ==== Simulate the remaining steps ====
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
+        
+        with self.phase("steps"):
+            t_rest = t[step:]
+            entry_idx, opstate_idx, p_in, p_out = self.step_arrays(t_rest, \
+                p_in_profile, switch_times, entry_states, entry_before)
+        
+        with self.phase("integration"):
+            if self.mode == "step":
+                battery = engine.integrate_battery(battery_before, \
+                    (p_in - p_out)/1000*self.dt, self.batt_cap)
+            else:
+                battery = self.integrate_segments(p_in_profile, \
+                    switch_times, entry_states, len(t), \
+                    first=entry_before+1, battery=battery_before)
+        
+        # ==== Replace the remaining steps in the simulation data ====
+        with self.phase("assembly"):
+            rest = self.build_sim_data(t_rest, opstate_idx, p_in, p_out, \
+                                       battery, self.compact)
+            
+            if self.compact:
+                self.sim_data = SimResult.concat([self.sim_data[:step], \
+                                                  rest])
+            else:
+                rest.index = rest.index + step
+                self.sim_data = pd.concat([self.sim_data.iloc[:step], rest])
+            self.checkpoints = pd.concat([ \
+                self.checkpoints[checkpoint_steps < step], \
+                self.make_checkpoints(t_rest, entry_idx, opstate_idx, \
+                    battery, battery_before, entry_before, step)], \
+                ignore_index=True)
         self.schedule = schedule
         
-        # Set up the loop
-        steps = int(np.ceil(self.tsim/self.dt))
+        self.profiler.count("steps", len(t_rest))
+        self.profiler.memory(self.data_bytes(self.sim_data))
+        self.finish_profile()
+        return self.sim_data
+    
+    def propagate_stream(self, schedule_unsorted, tsim=10, dt=1, \
+                         chunk_size=65536, sink=None, input_mode="sample"):
+        """Propagates the schedule in chunks of chunk_size steps, and yields
+        the simulation dataframe of each chunk, writing it to sink if given.
+        The chunks are not kept in self.sim_data."""
+        
+        self.reset_sim_data()
+        
+        self.dt = dt
+        self.tsim = tsim
+        self.mode = "step"
+        self.input_mode = input_mode
+        self.checkpoints = None
+        
+        self.start_profile("propagate_stream")
+        profiler = self.profiler
+        
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
+        
+        with self.phase("schedule"):
+            self.schedule, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, tsim, dt)
+        
+        battery = self.batt_init
+        entry = 0
         step = 0
-        t = 0
+        
+        if sink is not None:
+            sink.open(self.datacols, list(self.opstates.keys()))
+        
+        try:
+            for t in engine.timeline_chunks(tsim, dt, chunk_size):
+                
+                with profiler.phase("steps"):
+                    entry_idx, opstate_idx, p_in, p_out = \
+                        self.step_arrays(t, p_in_profile, switch_times, \
+                                         entry_states, entry)
+                
+                with profiler.phase("integration"):
+                    levels = engine.integrate_battery(battery, \
+                        (p_in - p_out)/1000*dt, self.batt_cap)
+                
+                with profiler.phase("assembly"):
+                    chunk = self.build_sim_data(t, opstate_idx, p_in, p_out, \
+                                                levels)
+                    chunk.index = chunk.index + step
+                profiler.memory(self.data_bytes(chunk))
+                
+                if sink is not None:
+                    with profiler.phase("sink"):
+                        sink.write(chunk)
+                
+                # Time spent by the consumer of the chunks
+                with profiler.phase("consumer"):
+                    yield chunk
+                
+                # Carry the running variables over to the next chunk
+                battery = levels[-1]
+                entry = entry_idx[-1]
+                step += len(t)
+        finally:
+            if sink is not None:
+                sink.close()
+        
+        self.profiler = profiler
+        profiler.count("steps", step)
+        self.finish_profile()
+    
+    def propagate_stats(self, schedule_unsorted, tsim=10, dt=1, \
+                        soc_limit=None, stop_early=True, chunk_size=65536, \
+                        input_mode="sample"):
+        """Propagates the schedule like propagate(), but only keeps running
+        statistics, a chunk of steps at a time. If soc_limit is given, the
+        first breach is reported, and with stop_early the run stops there.
+        Returns a dict of statistics, also kept in self.stats."""
+        
+        self.reset_sim_data()
+        
+        self.dt = dt
+        self.tsim = tsim
+        self.mode = "step"
+        self.input_mode = input_mode
+        self.checkpoints = None
+        
+        self.start_profile("propagate_stats")
+        
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
+        
+        with self.phase("schedule"):
+            self.schedule, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, tsim, dt)
+        
+        stats = engine.BatteryStats(self.batt_init, self.batt_cap, \
+                                    len(self.state_list))
         battery = self.batt_init
+        entry = 0
+        t_breach = None
         
-        opstate_i = 0
-        opstate_curr = schedule[opstate_i][1]  # Operation at time 0
-
-        if len(schedule) == 1:
-            top_next = tsim
-        else:
-            top_next = schedule[opstate_i+1][0] # Time when operation will be switched next
-
-
-        #%%########## SIM LOOP ##############
-        while t <= tsim:
-            
-            # If operation switches during this timestep, update top_next to find 
-            # when the next operation switch will take place.
-            if t >= top_next:
-                if opstate_i == len(schedule)-2:
-                    opstate_i += 1
-                    top_next = tsim+1  
-                else:
-                    opstate_i += 1
-                    top_next = schedule[opstate_i+1][0]
+        for t in engine.timeline_chunks(tsim, dt, chunk_size):
             
-            # Prepare empty line of data entries for this timestep
-            data_i = pd.DataFrame(index=[step], columns=self.datacols)
+            with self.phase("steps"):
+                entry_idx, opstate_idx, p_in, p_out = \
+                    self.step_arrays(t, p_in_profile, switch_times, \
+                                     entry_states, entry)
             
-            # ==== Current time ====
-            data_i.loc[step,"t"] = t
+            with self.phase("integration"):
+                levels = engine.integrate_battery(battery, \
+                    (p_in - p_out)/1000*dt, self.batt_cap)
             
-            # ==== Currently scheduled operation ====       
-            opstate_curr = schedule[opstate_i][1]
-            data_i.loc[step,"OpState"] = opstate_curr
-            
-            # ==== Current total P_in ====
-            p_in_curr = p_in_tot[round(t)%len(p_in_tot)]*1000 #Express in mW
+            with self.phase("stats"):
+                if soc_limit is not None and t_breach is None:
+                    below = np.flatnonzero(levels < soc_limit*self.batt_cap)
+                    if len(below) > 0:
+                        t_breach = t[below[0]]
+                        if stop_early:
+                            stop = below[0] + 1
+                            t, opstate_idx, p_in, p_out, levels = \
+                                t[:stop], opstate_idx[:stop], p_in[:stop], \
+                                p_out[:stop], levels[:stop]
+                
+                stats.update(t, opstate_idx, p_in, p_out, levels)
             
-            # Subtract lifetime degradation
-            p_in_curr = p_in_curr * (1-self.config["years_passed"] \
-                * self.config["panel_degradation_factor"])
+            if t_breach is not None and stop_early:
+                break
             
-            data_i.loc[step,"p_in"] = p_in_curr
+            # Carry the running variables over to the next chunk
+            battery = levels[-1]
+            entry = entry_idx[-1]
+        
+        with self.phase("assembly"):
+            self.stats = self.stats_summary(stats, t_breach)
+        
+        self.profiler.count("steps", stats.steps)
+        self.finish_profile()
+        return self.stats
+    
+    def stats_summary(self, stats, t_breach=None):
+        """Turns the running statistics of propagate_stats() into a dict."""
+        
+        states = pd.Index(list(self.opstates.keys()), name="OpState")
+        t_opstate = stats.state_steps*self.dt
+        # Energy in [J], from power in [mW], including telemetry blips
+        e_out_opstate = stats.state_p_out/1000*self.dt
+        
+        return {
+            "battery_min"   : stats.battery_min,
+            "t_battery_min" : stats.t_battery_min,
+            "battery_max"   : stats.battery_max,
+            "t_battery_max" : stats.t_battery_max,
+            "battery_end"   : stats.battery_end,
+            "soc_min"       : stats.battery_min/self.batt_cap,
+            "soc_end"       : stats.battery_end/self.batt_cap,
+            "dod_max"       : stats.discharge/self.batt_cap,
+            "t_full"        : stats.steps_full*self.dt,
+            "t_empty"       : stats.steps_empty*self.dt,
+            "e_in"          : stats.state_p_in.sum()/1000*self.dt,
+            "e_out"         : e_out_opstate.sum(),
+            "t_opstate"     : pd.Series(t_opstate, index=states),
+            "e_in_opstate"  : pd.Series(stats.state_p_in/1000*self.dt, \
+                                        index=states),
+            "e_out_opstate" : pd.Series(e_out_opstate, index=states),
+            "e_out_device"  : pd.Series(t_opstate @ self.state_device/1000, \
+                                index=pd.Index(list(self.device_channels), \
+                                               name="device")),
+            "e_out_channel" : pd.Series(t_opstate @ self.state_channel/1000,\
+                                index=pd.Index(self.channels, \
+                                               name="channel")),
+            "breached"      : t_breach is not None,
+            "t_breach"      : t_breach,
+            "t_end"         : stats.t_end,
+            }
+    
+    def propagate_periodic(self, periodic, dt=1, compact=False, \
+                           input_mode="sample"):
+        """Propagates a PeriodicSchedule one period at a time, carrying the
+        battery over between periods. Returns the simulation dataframe of the
+        first period, and keeps one row per period in self.cycle_data."""
+        
+        if not isinstance(periodic, PeriodicSchedule):
+            raise TypeError("propagate_periodic() needs a PeriodicSchedule! \
+                            Use propagate() for other schedules.")
+        self.require_fixed_input("propagate_periodic()")
+        
+        period = periodic.period
+        steps = self.period_steps(period, dt)
+        
+        self.reset_sim_data()
+        
+        self.dt = dt
+        self.mode = "periodic"
+        self.compact = compact
+        self.input_mode = input_mode
+        
+        self.start_profile("propagate_periodic")
+        
+        # Number of periods, of which the last may be cut short
+        if periodic.repeats is not None:
+            total = periodic.repeats*steps
+        else:
+            total = int(np.floor(periodic.end/dt)) + 1
+        cycles = -(-total//steps)
+        last_steps = total - (cycles-1)*steps
+        
+        t, entry_idx, opstate_idx, p_in, p_out = \
+            self.period_arrays(periodic.template, period, dt, cycles > 1)
+        
+        # ==== Battery of every period ====
+        with self.phase("integration"):
+            cycle = engine.integrate_cycles(self.batt_init, \
+                self.cycle_delta, self.batt_cap, cycles, last_steps)
+        
+        with self.phase("assembly"):
+            cycle_steps = np.full(cycles, steps)
+            cycle_steps[-1] = last_steps
+            e_in = np.cumsum(p_in)/1000*dt
+            e_out = np.cumsum(p_out)/1000*dt
+            t_start = np.arange(cycles)*period
             
-            # ==== Current total P_out ====
-            p_out_curr = self.opstates[opstate_curr].power_used()
-            data_i.loc[step,"p_out"] = -p_out_curr
-            # Note the minus here, p_out will be logged as negative
+            self.cycle_data = pd.DataFrame({
+                "t_start"       : t_start,
+                "steps"         : cycle_steps,
+                "battery_start" : cycle["start"],
+                "battery_end"   : cycle["end"],
+                "battery_min"   : cycle["min"],
+                "t_battery_min" : t_start + cycle["argmin"]*dt,
+                "battery_max"   : cycle["max"],
+                "t_battery_max" : t_start + cycle["argmax"]*dt,
+                "t_full"        : cycle["steps_full"]*dt,
+                "t_empty"       : cycle["steps_empty"]*dt,
+                "e_in"          : e_in[cycle_steps-1],
+                "e_out"         : e_out[cycle_steps-1],
+                "offset"        : cycle["start"] - cycle["start"][0],
+                })
             
-            # ==== Current sun visibility ====
-            if p_in_curr == 0:
-                data_i.loc[step,"sun"] = 0
-            else:
-                data_i.loc[step,"sun"] = 1
+            # Simulation data of the first period
+            stored = cycle_steps[0]
+            t, opstate_idx, p_in, p_out = t[:stored], opstate_idx[:stored], \
+                p_in[:stored], p_out[:stored]
+            battery = self.cycle_battery(0)
             
+            self.tsim = t[-1]
+            self.sim_data = self.build_sim_data(t, opstate_idx, p_in, \
+                                                p_out, battery, compact)
+            self.checkpoints = self.make_checkpoints(t, entry_idx[:stored], \
+                opstate_idx, battery, self.batt_init)
+        
+        self.profiler.count("steps", stored)
+        self.profiler.count("cycles", cycles)
+        self.profiler.memory(self.data_bytes(self.sim_data) \
+                             + int(self.cycle_data.memory_usage().sum()))
+        self.finish_profile()
+        return self.sim_data
+    
+    def period_steps(self, period, dt):
+        """Returns the number of steps in a period of a periodic schedule,
+        after checking that the input power and the telemetry blips repeat
+        along with it."""
+        
+        steps = int(round(period/dt))
+        t_orbit = self.orbit().period()
+        if not np.isclose(steps*dt, period):
+            raise ValueError("The period of the schedule ({} [s]) must be a \
+                             multiple of dt ({} [s])!".format(period, dt))
+        if not np.isclose(period/t_orbit, max(round(period/t_orbit), 1)):
+            raise ValueError("The period of the schedule ({} [s]) must be a \
+                             whole number of orbits ({} [s])!" \
+                             .format(period, t_orbit))
+        if self.has_blips() and not np.isclose(period/self.blip_period, \
+                round(period/self.blip_period)):
+            raise ValueError("The period of the schedule ({} [s]) must be a \
+                             multiple of blip_period ({} [s])!" \
+                             .format(period, self.blip_period))
+        return steps
+    
+    def period_arrays(self, template, period, dt, repeated=True):
+        """Returns the time, schedule entry, OpState index, P_in and P_out 
+        of every step of one period of a periodic schedule, and keeps the
+        change in battery charge of every step in self.cycle_delta. If the
+        period is repeated, the schedule must not lag into the next one."""
+        
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
+        
+        with self.phase("schedule"):
+            self.schedule, switch_times, entry_states = \
+                self.compile_schedule(template, period, dt)
+        
+        with self.phase("steps"):
+            t = np.arange(self.period_steps(period, dt))*dt
+            entry_idx, opstate_idx, p_in, p_out = \
+                self.step_arrays(t, p_in_profile, switch_times, entry_states)
             
-            # ==== Current battery level ====            
-            battery += (p_in_curr - p_out_curr)/1000*dt # /1000 'cause mW -> W
+            # Every period must end on the last entry of the template,
+            #   otherwise the schedule lags into the next period.
+            if repeated and entry_idx[-1] != len(self.schedule) - 1:
+                raise ValueError("The last entries of the template are too \
+                                 close to the end of the period for this \
+                                 dt! Choose a smaller dt.")
             
-            # Preventing battery values from going out of bounds
-            if battery > self.batt_cap:
-                battery = self.batt_cap
-            elif battery < 0:
-                battery = 0
+            delta = (p_in - p_out)/1000*dt
+            delta.flags.writeable = False
+            self.cycle_delta = delta
         
-            data_i.loc[step,"battery"] = battery
-            
-            # ==== Power usage per channel ====
-            power_channels = self.opstates[opstate_curr].power_used_channel()
-            for channel in power_channels.keys():
-                data_i.loc[step,channel] = power_channels[channel]            
+        return t, entry_idx, opstate_idx, p_in, p_out
+    
+    def cycle_battery(self, cycle):
+        """Returns the battery charge after every step of a period of the 
+        last propagate_periodic(), integrated from its starting charge."""
+        if self.cycle_data is None:
+            raise RuntimeError("No periods to look at! Please run the \
+                               .propagate_periodic() method before \
+                               continuing!")
+        
+        steps = self.cycle_data["steps"].iloc[cycle]
+        return engine.integrate_battery( \
+            self.cycle_data["battery_start"].iloc[cycle], \
+            self.cycle_delta[:steps], self.batt_cap)
+    
+    def limit_cycle(self, schedule, period=None, dt=1, compact=False, \
+                    input_mode="sample"):
+        """Finds the charge that every period of a repeating schedule starts
+        at once the battery has settled, and the number of periods it takes.
+        Returns a dict, also kept in self.steady_state, and keeps the settled
+        period in self.sim_data."""
+        
+        if isinstance(schedule, PeriodicSchedule):
+            schedule, period = schedule.template, schedule.period
+        elif period is None:
+            raise ValueError("limit_cycle() needs the period of the \
+                             schedule!")
+        self.require_fixed_input("limit_cycle()")
+        self.period_steps(period, dt)
+        
+        self.reset_sim_data()
+        
+        self.dt = dt
+        self.mode = "limit_cycle"
+        self.compact = compact
+        self.input_mode = input_mode
+        
+        self.start_profile("limit_cycle")
+        
+        t, entry_idx, opstate_idx, p_in, p_out = \
+            self.period_arrays(schedule, period, dt)
+        
+        with self.phase("integration"):
+            net, low, high = engine.cycle_map(self.cycle_delta, self.batt_cap)
+            battery_start, cycles = engine.limit_cycle(self.batt_init, net, \
+                                                       low, high)
+            battery = engine.integrate_battery(battery_start, \
+                                               self.cycle_delta, self.batt_cap)
+        
+        with self.phase("assembly"):
+            self.tsim = t[-1]
+            self.sim_data = self.build_sim_data(t, opstate_idx, p_in, \
+                                                p_out, battery, compact)
+            self.checkpoints = self.make_checkpoints(t, entry_idx, \
+                opstate_idx, battery, battery_start)
             
-            # ==== Power usage per device ====
-            power_devices = self.opstates[opstate_curr].power_used_device()
-            for device in power_devices.keys():
-                data_i.loc[step,device] = power_devices[device]
+            summary = self.summarize()
+            self.steady_state = {
+                "battery_start" : battery_start,
+                "soc_start"     : battery_start/self.batt_cap,
+                "cycles"        : cycles,
+                "net"           : net,
+                "battery_low"   : low,
+                "battery_high"  : high,
+                "battery_min"   : summary["battery_min"],
+                "t_battery_min" : summary["t_battery_min"],
+                "battery_max"   : summary["battery_max"],
+                "t_battery_max" : t[np.argmax(battery)],
+                "soc_min"       : summary["soc_min"],
+                "t_full"        : summary["t_full"],
+                "t_empty"       : summary["t_empty"],
+                "e_in"          : summary["e_in"],
+                "e_out"         : summary["e_out"],
+                "residual"      : battery[-1] - battery_start,
+                }
+        
+        self.profiler.count("steps", len(t))
+        self.profiler.memory(self.data_bytes(self.sim_data))
+        self.finish_profile()
+        return self.steady_state
+    
+    def propagate_segments(self, schedule_unsorted, tsim=10, dt=1, \
+                           input_mode="sample"):
+        """Propagates the schedule segment by segment, and returns one row
+        per segment. Unless dt is a whole number of seconds or a binary
+        fraction of one, the cost grows with tsim/dt. No steps are kept."""
+        
+        self.reset_sim_data()
+        
+        self.dt = dt
+        self.tsim = tsim
+        self.mode = "segments"
+        self.input_mode = input_mode
+        self.checkpoints = None
+        
+        self.require_fixed_input("propagate_segments()")
+        self.require_constant_output("propagate_segments()")
+        self.start_profile("propagate_segments")
+        
+        with self.phase("schedule"):
+            self.schedule, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, tsim, dt)
+        
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
+        
+        steps = engine.timeline_length(tsim, dt)
+        with self.phase("integration"):
+            self.integrate_segments(p_in_profile, switch_times, \
+                                    entry_states, steps, fill=False)
+        
+        self.profiler.count("steps", steps)
+        self.profiler.count("segments", len(self.segment_data))
+        self.profiler.memory(self.data_bytes(self.segment_data))
+        self.finish_profile()
+        return self.segment_data
+    
+    def integrate_segments(self, p_in_profile, switch_times, entry_states, \
+                           steps, fill=True, first=0, battery=None):
+        """Integrates the battery segment by segment into self.segment_data,
+        starting from segment first with the given battery charge. If fill
+        is set, returns the battery charge at every step."""
+        
+        self.require_fixed_input("Segment-wise integration")
+        self.require_constant_output("Segment-wise integration")
+        
+        if battery is None:
+            battery = self.batt_init
+        
+        if not engine.exact_clock(self.dt, steps):
+            print("\x1b[31mWarning: dt =", self.dt, "[s] is not a whole", \
+                  "number of seconds or a binary fraction of one, so the", \
+                  "steps do not line up with the orbit exactly, and the", \
+                  "segment-wise integration looks at every step. Choose a", \
+                  "dt such as 0.5 or 0.25 instead. \x1b[0m")
+        
+        starts = engine.segment_starts(switch_times, self.dt, steps)
+        cycle = engine.input_cycle(p_in_profile, self.dt, steps, \
+                                   self.input_mode)
+        
+        p_out = self.state_power[entry_states[:len(starts)]]
+        
+        starts, p_out = starts[first:], p_out[first:]
+        segments, pieces = engine.integrate_segments(battery, \
+            starts, p_out, cycle, steps, self.dt, self.batt_cap)
+        
+        stops = np.append(starts[1:], steps)
+        segment_data = pd.DataFrame(segments, columns=["battery_start", \
+            "battery_end", "battery_min", "battery_max", "steps_full", \
+            "steps_empty"])
+        segment_data.insert(0, "t_start", starts*self.dt)
+        segment_data.insert(1, "t_end", stops*self.dt)
+        segment_data.insert(2, "OpState", np.array(list(self.opstates.keys()), \
+            dtype=object)[entry_states[first:first+len(starts)]])
+        segment_data["e_in"] = cycle.energy(stops) - cycle.energy(starts)
+        segment_data["e_out"] = p_out/1000*self.dt*(stops-starts)
+        segment_data["t_full"] = segment_data.pop("steps_full")*self.dt
+        segment_data["t_empty"] = segment_data.pop("steps_empty")*self.dt
+        
+        if first > 0:
+            segment_data = pd.concat([self.segment_data.iloc[:first], \
+                                      segment_data], ignore_index=True)
+        self.segment_data = segment_data
+        
+        if fill:
+            return engine.fill_battery(pieces, starts, p_out, cycle, steps, \
+                                       self.dt)
+    
+    def propagate_adaptive(self, schedule_unsorted, tsim=10, dt_max=60, \
+                           dt_min=1, refine_window=10, compact=False):
+        """Propagates the schedule with steps of varying length, and returns
+        the simulation dataframe. The error bounds are kept in
+        self.step_report, and the length of every step in self.dt."""
+        
+        self.reset_sim_data()
+        
+        self.tsim = tsim
+        self.mode = "adaptive"
+        self.compact = compact
+        self.input_mode = "average"
+        self.checkpoints = None
+        
+        self.require_fixed_input("propagate_adaptive()")
+        self.start_profile("propagate_adaptive")
+        
+        with self.phase("input"):
+            p_in_profile = self.input_profile()
+        
+        with self.phase("schedule"):
+            self.schedule, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, tsim)
+        
+        with self.phase("steps"):
+            # Set up the timeline around the schedule switches and eclipses
+            eclipses = engine.eclipse_transitions(p_in_profile, tsim)
+            t, self.dt = engine.adaptive_timeline(tsim, switch_times, \
+                np.column_stack((eclipses-refine_window, \
+                                 eclipses+refine_window)), dt_min, dt_max)
             
-            # ==== Concatenate current data line with complete dataframe
+            # Every switch is landed on, so the schedule is never behind
+            entry_idx = self.schedule.entry_index(t)
+            opstate_idx = entry_states[entry_idx]
             
-            self.sim_data = pd.concat([self.sim_data, data_i])
+            p_in = engine.sample_input(p_in_profile, t, self.dt, "average")
+            p_out = self.output_power(t, opstate_idx, self.dt)
+        
+        with self.phase("integration"):
+            battery = engine.integrate_battery(self.batt_init, \
+                                               (p_in - p_out)/1000*self.dt, \
+                                               self.batt_cap)
+        
+        # ==== Error bounds ====
+        with self.phase("error_bounds"):
+            # While the net power keeps the same sign, the charge only moves 
+            #   one way, and clamping at the end of the step is exact. 
+            #   Otherwise, the charge strays at most this far from the 
+            #   straight line between the charges at both ends of the step.
+            lowest, highest = engine.input_range(p_in_profile, t, self.dt)
+            # With blips, P_out also varies within the step
+            out_low, out_high = p_out, p_out
+            if self.has_blips():
+                base = self.state_power[opstate_idx]
+                blips = self.blip_power*self.state_blips[opstate_idx]
+                fraction = engine.blip_fraction(t, self.dt, \
+                    self.blip_period, self.blip_duration)
+                out_low = np.where(fraction >= 1, base + blips, base)
+                out_high = np.where(fraction > 0, base + blips, base)
+            deviation = np.where((lowest < out_high) & (out_low < highest), \
+                                 (highest-lowest + out_high-out_low) \
+                                 / 1000*self.dt/2, 0.)
+            ends = np.stack((np.append(self.batt_init, battery)[:-1], \
+                             battery))
+            margin = np.minimum(ends, self.batt_cap-ends).min(axis=0)
+            # Only steps that can touch empty or full add to the error, and 
+            #   clamping never makes an earlier error grow.
+            error = np.where(margin < deviation, 2*deviation, 0.)
+        
+        self.step_report = {
+            "steps"             : len(t),
+            "dt_min"            : self.dt.min() if len(t) > 0 else 0,
+            "dt_max"            : self.dt.max() if len(t) > 0 else 0,
+            "error_bound"       : error.sum(),
+            "error_bound_step"  : error.max() if len(t) > 0 else 0,
+            }
+        
+        with self.phase("assembly"):
+            self.sim_data = self.build_sim_data(t, opstate_idx, p_in, p_out, \
+                                                battery, compact)
+        
+        self.profiler.count("steps", len(t))
+        self.profiler.memory(self.data_bytes(self.sim_data))
+        self.finish_profile()
+        return self.sim_data
+    
+    def sweep(self, schedule_unsorted, tsim=10, dt=1, traces=False, \
+              grid=False, chunk_size=65536, input_mode="sample", \
+              **parameters):
+        """Propagates the schedule for many variants of the config at once,
+        given as keyword arguments holding arrays. Returns a dataframe with
+        one row per variant, and the battery of every variant if traces is
+        set."""
+        
+        for name in parameters:
+            if name not in self.sweep_parameters:
+                raise ValueError("Cannot sweep over '{}'! Choose from {}." \
+                                 .format(name, self.sweep_parameters))
+        
+        values = [np.atleast_1d(parameters.get(name, self.config[name])) \
+                  for name in self.sweep_parameters]
+        if grid:
+            values = [v.ravel() for v in np.meshgrid(*values, indexing="ij")]
+        else:
+            values = [v.ravel() for v in np.broadcast_arrays(*values)]
+        variants = pd.DataFrame(dict(zip(self.sweep_parameters, values)))
+        
+        self.require_fixed_input("sweep()")
+        self.start_profile("sweep")
+        
+        batt_cap = (variants["battery_capacity"] \
+            * (1-variants["years_passed"] \
+               * variants["battery_degradation_factor"])).to_numpy()
+        battery = variants["battery_init"].to_numpy()*batt_cap
+        panel_factor = (1-variants["years_passed"] \
+            * variants["panel_degradation_factor"]).to_numpy()
+        
+        # Input power only depends on the altitude, so it is set up once
+        #   for each altitude in the sweep.
+        altitudes, altitude_idx = np.unique(variants["orbital_altitude"], \
+                                            return_inverse=True)
+        with self.phase("input"):
+            p_in_tots = [self.power_input(altitude.item()) \
+                         for altitude in altitudes]
+        
+        with self.phase("schedule"):
+            _, switch_times, entry_states = \
+                self.compile_schedule(schedule_unsorted, tsim, dt)
+        with self.phase("steps"):
+            t = engine.timeline(tsim, dt)
+            opstate_idx = entry_states[engine.schedule_index(t, \
+                                                             switch_times)]
+        
+        summary = {
+            # Over the steps only, like summarize() and propagate_stats()
+            "battery_min" : np.full(len(variants), np.inf),
+            "battery_max" : np.full(len(variants), -np.inf),
+            "steps_full"  : np.zeros(len(variants), dtype=int),
+            "steps_empty" : np.zeros(len(variants), dtype=int),
+            "e_in"        : np.zeros(len(variants)),
+            "e_out"       : 0.,
+            }
+        levels = []
+        
+        for start in range(0, len(t), chunk_size):
+            with self.phase("steps"):
+                t_chunk = t[start:start+chunk_size]
+                p_out = self.output_power(t_chunk, \
+                    opstate_idx[start:start+chunk_size], dt)
+                
+                # ==== P_in of every variant, as (steps, variants) ====
+                p_in = np.stack([engine.sample_input(p_in_tot, t_chunk, dt, \
+                                                     input_mode)*1000 \
+                                 for p_in_tot in p_in_tots], axis=1)
+                p_in = p_in[:, altitude_idx] * panel_factor
             
+            # ==== Battery level of every variant ====
+            with self.phase("integration"):
+                chunk = engine.integrate_battery_batch(battery, \
+                    (p_in - p_out[:, None])/1000*dt, batt_cap)
+                battery = chunk[-1]
             
-            # Propagate running variables
-            step += 1
-            t += dt
+            with self.phase("assembly"):
+                summary["battery_min"] = np.minimum(summary["battery_min"], \
+                                                    chunk.min(axis=0))
+                summary["battery_max"] = np.maximum(summary["battery_max"], \
+                                                    chunk.max(axis=0))
+                summary["steps_full"] += (chunk == batt_cap).sum(axis=0)
+                summary["steps_empty"] += (chunk == 0).sum(axis=0)
+                summary["e_in"] += p_in.sum(axis=0)/1000*dt
+                summary["e_out"] += p_out.sum()/1000*dt
+                
+                if traces:
+                    levels.append(chunk)
+            self.profiler.memory(chunk.nbytes*(len(levels) if traces else 1))
+        
+        variants["batt_cap"] = batt_cap
+        variants["battery_min"] = summary["battery_min"]
+        variants["battery_max"] = summary["battery_max"]
+        variants["battery_end"] = battery
+        variants["soc_min"] = summary["battery_min"]/batt_cap
+        variants["soc_end"] = battery/batt_cap
+        variants["t_full"] = summary["steps_full"]*dt
+        variants["t_empty"] = summary["steps_empty"]*dt
+        variants["e_in"] = summary["e_in"]
+        variants["e_out"] = summary["e_out"]
+        
+        self.profiler.count("steps", len(t))
+        self.profiler.count("variants", len(variants))
+        self.finish_profile()
+        
+        if traces:
+            return variants, np.concatenate(levels).T
+        return variants
+    
+    def build_sim_data(self, t, opstate_idx, p_in, p_out, battery, \
+                       compact=False):
+        """Builds the simulation data from per-step arrays. If compact is
+        set, returns a SimResult, which looks up the power of every channel
+        and device from the OpState index when asked for. Otherwise, returns
+        the full simulation dataframe."""
+        
+        result = SimResult(t, opstate_idx, p_in, \
+                           -p_out, # Note the minus, p_out is logged negative
+                           (p_in != 0).astype(int), battery, \
+                           list(self.opstates.keys()), self.channels, \
+                           list(self.device_channels.keys()), \
+                           self.state_channel, self.state_device)
+        
+        if compact:
+            return result
+        return result.to_frame()
+    
+    def summarize(self):
+        """Returns a dict summarizing the battery behaviour and energy
+        balance of the last simulation."""
         
-        runtime = round(time.time()-begin,3)
-        print("\x1b[1;30;43m", "Runtime:", runtime, "[s]", "\x1b[0m")
-        return self.sim_data
+        if not self.schedule:
+            raise RuntimeError("Summary cannot be made before a simulation \
+                               is completed! Please run the .propagate() \
+                               method before continuing!")
+        
+        # After propagate_periodic(), the summary covers every period
+        if self.mode == "periodic":
+            cycles = self.cycle_data
+            i_min = int(np.argmin(cycles["battery_min"].to_numpy()))
+            return {
+                "battery_min"   : cycles["battery_min"].iloc[i_min],
+                "t_battery_min" : cycles["t_battery_min"].iloc[i_min],
+                "battery_max"   : cycles["battery_max"].max(),
+                "battery_end"   : cycles["battery_end"].iloc[-1],
+                "soc_min"       : cycles["battery_min"].iloc[i_min] \
+                    / self.batt_cap,
+                "soc_end"       : cycles["battery_end"].iloc[-1] \
+                    / self.batt_cap,
+                "t_full"        : cycles["t_full"].sum(),
+                "t_empty"       : cycles["t_empty"].sum(),
+                "e_in"          : cycles["e_in"].sum(),
+                "e_out"         : cycles["e_out"].sum(),
+                }
+        
+        # propagate_segments(), propagate_stats() and propagate_stream() keep
+        #   no steps, and return their own results instead.
+        if len(self.sim_data) == 0:
+            raise RuntimeError("The last simulation kept no steps to \
+                               summarize! Use the results it returned \
+                               instead.")
+        
+        battery = np.asarray(self.sim_data["battery"], dtype=float)
+        i_min = int(np.argmin(battery))
+        
+        # Steps are all dt long, except after propagate_adaptive()
+        if np.ndim(self.dt) == 0:
+            duration = lambda mask: np.count_nonzero(mask)*self.dt
+            energy = lambda power: power.sum()/1000*self.dt
+        else:
+            duration = lambda mask: self.dt[mask].sum()
+            energy = lambda power: np.dot(power, self.dt)/1000
+        
+        return {
+            "battery_min"   : battery[i_min],
+            "t_battery_min" : np.asarray(self.sim_data["t"])[i_min],
+            "battery_max"   : battery.max(),
+            "battery_end"   : battery[-1],
+            "soc_min"       : battery[i_min]/self.batt_cap,
+            "soc_end"       : battery[-1]/self.batt_cap,
+            "t_full"        : duration(battery == self.batt_cap),
+            "t_empty"       : duration(battery == 0),
+            "e_in"          : energy(self.sim_data["p_in"]),
+            "e_out"         : -energy(self.sim_data["p_out"]),
+            }
+    
+    def step_opstates(self):
+        """Returns the index into state_list of the OpState at every step of
+        the last simulation."""
+        if isinstance(self.sim_data, SimResult):
+            return self.sim_data.opstate_idx
+        return pd.Index(self.state_list).get_indexer(self.sim_data["OpState"])
+    
+    def channel_currents(self, channel_voltages):
+        """Returns the current in [mA] of every channel in channel_voltages,
+        given in [V], in every OpState, as an array of (states x channels).
+        """
+        unknown = [channel for channel in channel_voltages \
+                   if channel not in self.channels]
+        if unknown:
+            raise ValueError("Cannot work out the current of channels that \
+                             are not in channels: {}".format(unknown))
+        
+        columns = [self.channels.index(channel) \
+                   for channel in channel_voltages]
+        return self.state_channel[:, columns] \
+            / np.array(list(channel_voltages.values()), dtype=float)
+    
+    def check_channel_currents(self, channel_voltages, current_limits):
+        """Returns the intervals in which the current of a channel exceeds
+        its limit in [mA], with the channel voltages in [V], as a dataframe
+        of channel, start, end, duration, peak and limit."""
         
+        if not self.schedule:
+            raise RuntimeError("Currents cannot be checked before a \
+                               simulation is completed! Please run the \
+                               .propagate() method before continuing!")
+        
+        missing = [channel for channel in current_limits \
+                   if channel not in channel_voltages]
+        if missing:
+            raise ValueError("No voltage given for channels with a current \
+                             limit: {}".format(missing))
+        
+        currents = self.channel_currents({channel : channel_voltages[channel] \
+                                          for channel in current_limits})
+        limits = np.array(list(current_limits.values()), dtype=float)
+        
+        # ==== Runs of steps in the same OpState ====
+        opstate_idx = self.step_opstates()
+        first = engine.runs(opstate_idx)
+        bounds = np.append(first, len(opstate_idx))
+        
+        column, start, end, peak = \
+            engine.exceedances(currents[opstate_idx[first]], limits)
+        
+        # Intervals end at the end of their last step
+        t = np.asarray(self.sim_data["t"], dtype=float)
+        last = bounds[end] - 1
+        t_end = t[last] + np.broadcast_to(self.dt, t.shape)[last]
+        t_start = t[first[start]]
+        
+        return pd.DataFrame({
+            "channel"  : np.array(list(current_limits), dtype=object)[column],
+            "start"    : t_start,
+            "end"      : t_end,
+            "duration" : t_end - t_start,
+            "peak"     : peak,
+            "limit"    : limits[column],
+            })
+    
+    def plot_line(self, ax, t, values, *args, **kwargs):
+        """Plots values against t on ax, like ax.plot(). Only the samples
+        that can be told apart at the pixel width of ax are drawn, so that
+        long simulations plot as fast as short ones."""
+        
+        t = np.asarray(t)
+        values = np.asarray(values, dtype=float)
+        keep = engine.decimate(values, int(np.ceil(ax.bbox.width)))
+        
+        return ax.plot(t[keep], values[keep], *args, **kwargs)
+    
+    def opstate_spans(self):
+        """Returns the start time, end time and OpState of every schedule
+        segment of the last simulation."""
+        
+        if self.checkpoints is not None:
+            starts = self.checkpoints["t"].to_numpy()
+            opstates = self.checkpoints["OpState"].to_numpy()
+        else:
+            # No checkpoints are kept for adaptive or streamed runs
+            t = np.asarray(self.sim_data["t"])
+            opstates = np.asarray(self.sim_data["OpState"])
+            first = engine.runs(opstates)
+            starts, opstates = t[first], opstates[first]
+        
+        return starts, np.append(starts[1:], self.tsim), opstates
     
-    def plot_pie_device(self):
+    def add_spans(self, ax, starts, ends, colours, alpha):
+        """Shades the given time spans over the full height of ax, each in
+        its own colour, as a single collection."""
+        
+        import matplotlib.collections as collections
+        
+        verts = np.zeros((len(starts), 4, 2))
+        verts[:, :2, 0] = starts[:, None]
+        verts[:, 2:, 0] = ends[:, None]
+        verts[:, 1:3, 1] = 1
+        
+        collection = collections.PolyCollection(verts, \
+            facecolors=colours, edgecolors="none", alpha=alpha, \
+            transform=ax.get_xaxis_transform())
+        ax.add_collection(collection)
+        
+    def plot_pie_device(self, show=True):
+        import matplotlib.pyplot as plt
+        
         devices = list(self.device_channels.keys())
         
         p_avg_device = []
         for device in devices:
-            p_avg_device.append(sum(self.sim_data[device]) \
-                                /len(self.sim_data[device]))
+            p_avg_device.append(np.mean(self.sim_data[device]))
         p_perc_device = []
         for i in range(len(devices)):
             p_perc_device.append(p_avg_device[i]/sum(p_avg_device)*100)
@@ -230,12 +1452,14 @@ class Mission:
         ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
         
         ax1.set_title("Percentage of total power consumption per device during mission")
-        plt.show()
+        if show:
+            plt.show()
         
         return p_avg_device, p_perc_device
     
     
     def plot_timeline_channel(self):
+        import matplotlib.pyplot as plt
         
         # Filter "None" from channels list
         channels = []
@@ -248,8 +1472,8 @@ class Mission:
             if channel == "None":
                 pass
             else:
-                ax1.plot(self.sim_data["t"], self.sim_data[channel], \
-                         label=channel)
+                self.plot_line(ax1, self.sim_data["t"], \
+                               self.sim_data[channel], label=channel)
         
         ax1.set_xlim(0, self.tsim)
         ax1.set_title('Power consumption over time per channel')
@@ -261,13 +1485,17 @@ class Mission:
     
         
     def plot_timeline_channel_currents(self, channel_voltages):
+        import matplotlib.pyplot as plt
         
         fig1, ax1 = plt.subplots()
         
-        for channel in channel_voltages:
-            current = \
-                [p/channel_voltages[channel] for p in self.sim_data[channel]]
-            ax1.plot(self.sim_data["t"], current, label=channel)
+        # Current of every channel per OpState, looked up for every step
+        currents = self.channel_currents(channel_voltages)
+        opstate_idx = self.step_opstates()
+        
+        for j, channel in enumerate(channel_voltages):
+            self.plot_line(ax1, self.sim_data["t"], \
+                           currents[opstate_idx, j], label=channel)
         
         # ax1.plot(self.sim_data["t"], self.sim_data["5V_1"], label="5V_1")
         ax1.set_title('Current in each channel over time')
@@ -278,6 +1506,7 @@ class Mission:
         
         
     def plot_bar_channel(self):
+        import matplotlib.pyplot as plt
         
         # Filter "None" from channels list
         channels = []
@@ -286,8 +1515,7 @@ class Mission:
         
         p_avg_channel = []
         for channel in channels:
-            p_avg_channel.append(sum(self.sim_data[channel]) \
-                                /len(self.sim_data[channel]))
+            p_avg_channel.append(np.mean(self.sim_data[channel]))
         
         fig1, ax1 = plt.subplots()
                 
@@ -299,13 +1527,15 @@ class Mission:
     
         
     def plot_timeline_device(self):
+        import matplotlib.pyplot as plt
         
         devices = list(self.device_channels.keys())
         
         fig1, ax1 = plt.subplots()
         
         for device in devices:
-            ax1.plot(self.sim_data["t"], self.sim_data[device], label=device)
+            self.plot_line(ax1, self.sim_data["t"], self.sim_data[device], \
+                           label=device)
         
         ax1.set_xlim(0, self.tsim)
         ax1.set_title('Power consumption over time per device')
@@ -314,7 +1544,8 @@ class Mission:
         ax1.legend()
         ax1.grid(True)
         
-    def plot_timeline_power(self, opstate_colours, show_ops=1):
+    def plot_timeline_power(self, opstate_colours, show_ops=1, show=True):
+        import matplotlib.pyplot as plt
         
         if not self.schedule:
             raise RuntimeError("Plot cannot be made before a simulation is \
@@ -325,18 +1556,9 @@ class Mission:
         
         # Plot operation history on timeline:
         
-        # Remove idle entries from schedule
-        rschedule = []
-        for i in range(len(self.schedule)):
-            # if self.schedule[i][1] != "idle":
-            rschedule.append([self.schedule[i][0],self.schedule[i][1]])
         # Add a dummy point beyond the view for line continuity
-        rschedule.append([self.tsim*1.01,"dummy"])
-        
-        # Fetch x_coordinates
-        xcoors = []
-        for i in range(len(rschedule)):
-            xcoors.append(rschedule[i][0])
+        labels = list(self.schedule.opstates) + ["dummy"]
+        xcoors = list(self.schedule.times) + [self.tsim*1.01]
         # Generate y_coordinates as zeroes
         ycoors = [0]*len(xcoors)
         
@@ -344,9 +1566,15 @@ class Mission:
         ax1[0].plot(xcoors, ycoors, "-o",
                 color="k", markerfacecolor="w")
         
-        # Plot line labels
-        for i in range(len(xcoors)):
-            ax1[0].annotate(rschedule[i][1], \
+        # Plot line labels, unless there are too many to tell apart, in
+        #   which case the OpState overlays show the schedule instead.
+        fontsize_px = 16*fig1.dpi/72
+        if len(xcoors) > ax1[0].bbox.width/fontsize_px:
+            xcoors_labelled = []
+        else:
+            xcoors_labelled = xcoors
+        for i in range(len(xcoors_labelled)):
+            ax1[0].annotate(labels[i], \
                             xy=(xcoors[i], 0), \
                             xytext=(xcoors[i], 0.15), \
                             fontsize=16, \
@@ -365,8 +1593,10 @@ class Mission:
         
         
         # Plot power in - power out
-        ax1[1].plot(self.sim_data["t"], self.sim_data["p_in"], 'black', \
-                    self.sim_data["t"], self.sim_data["p_out"],'red')
+        self.plot_line(ax1[1], self.sim_data["t"], self.sim_data["p_in"], \
+                       'black')
+        self.plot_line(ax1[1], self.sim_data["t"], self.sim_data["p_out"], \
+                       'red')
         ax1[1].set_xlim(0, self.tsim)
         ax1[1].set_xlabel('Time')
         ax1[1].set_ylabel('P_in and P_out [mW]')
@@ -374,10 +1604,9 @@ class Mission:
         
         
         # Plot battery charge
-        battery_perc = []
-        for entry in self.sim_data["battery"]:
-            battery_perc.append(100*entry/self.batt_cap)
-        ax1[2].plot(self.sim_data["t"], battery_perc, 'black')
+        battery_perc = 100*np.asarray(self.sim_data["battery"], \
+                                      dtype=float)/self.batt_cap
+        self.plot_line(ax1[2], self.sim_data["t"], battery_perc, 'black')
         ax1[2].set_xlim(0, self.tsim)
         ax1[2].set_ylim(0, 100)
         ax1[2].set_xlabel('Time')
@@ -386,40 +1615,25 @@ class Mission:
         
         # Plot colour overlays
         if show_ops == 1:
+            starts, ends, opstates = self.opstate_spans()
+            colours = [opstate_colours[os] for os in opstates]
             for q in range(len(ax1)):
-                # collection = collections.BrokenBarHCollection.span_where(
-                #     np.array(output_t), ymin=-1e10, ymax=1e10, where=np.array(output_sun) < 1, facecolor='black', alpha=0.6)
-                # ax1[q].add_collection(collection)
-                
-                for os in list(self.opstates.keys()):
-                    collection = collections.BrokenBarHCollection.span_where(
-                        np.array(self.sim_data["t"]), \
-                        ymin=-1e10, ymax=1e10, \
-                        where=np.array(self.sim_data["OpState"]) == os, \
-                        facecolor=opstate_colours[os], \
-                        alpha=0.3)
-                    ax1[q].add_collection(collection)
+                self.add_spans(ax1[q], starts, ends, colours, alpha=0.3)
                     
         else:
             # Plot sunlight blocks
+            t = np.asarray(self.sim_data["t"])
+            sun = np.asarray(self.sim_data["sun"])
+            first = engine.runs(sun)
+            starts = t[first]
+            ends = np.append(starts[1:], self.tsim)
+            
             for q in range(1,len(ax1)):
-                collection = collections.BrokenBarHCollection.span_where(
-                    np.array(self.sim_data["t"]), \
-                    ymin=-1e10, \
-                    ymax=1e10, \
-                    where=np.array(self.sim_data["sun"]) == 1, \
-                    facecolor='yellow', \
-                    alpha=0.3)
-                ax1[q].add_collection(collection)
-                
-                collection = collections.BrokenBarHCollection.span_where(
-                    np.array(self.sim_data["t"]), \
-                    ymin=-1e10, \
-                    ymax=1e10, \
-                    where=np.array(self.sim_data["sun"]) < 1, \
-                    facecolor='black', \
-                    alpha=0.6)
-                ax1[q].add_collection(collection)
+                sunlit = sun[first] == 1
+                self.add_spans(ax1[q], starts[sunlit], ends[sunlit], \
+                               'yellow', alpha=0.3)
+                self.add_spans(ax1[q], starts[~sunlit], ends[~sunlit], \
+                               'black', alpha=0.6)
         
         
         fig1.tight_layout()
@@ -437,10 +1651,12 @@ class Mission:
         # ax2[1].set_ylabel('Power use %')
         # ax2[1].set_title('Cumulative power consumption over mission')
         
-        plt.show()
+        if show:
+            plt.show()
         
         
-    def plot_pie_opstate(self, opstate_colours):
+    def plot_pie_opstate(self, opstate_colours, show=True):
+        import matplotlib.pyplot as plt
         
         if not self.schedule:
             raise RuntimeError("Plot cannot be made before a simulation is \
@@ -449,10 +1665,11 @@ class Mission:
                                
         opstates = list(self.opstates.keys())
         
+        opstate_column = np.asarray(self.sim_data["OpState"])
         opstate_perc = []
         for opstate in opstates:
-            os_count = self.sim_data["OpState"].tolist().count(opstate)
-            opstate_perc.append(100*os_count/len(self.sim_data["OpState"]))
+            os_count = np.count_nonzero(opstate_column == opstate)
+            opstate_perc.append(100*os_count/len(opstate_column))
         
         # Do plot
         fig1, ax1 = plt.subplots()
@@ -461,4 +1678,5 @@ class Mission:
         ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
         ax1.set_title('Fraction of operational state over whole mission')
         
-        plt.show()
+        if show:
+            plt.show()
@@ -8,18 +8,45 @@ orbit.py
 @author: Johan Monster (https://github.com/Hans-Bananendans/)
 """
 
+import numpy as np
 from numpy import log
 
+# Mean radius of the Earth in [km]
+R_EARTH = 6371
+
+# Regression coefficients (a, b) of e = a*log(h) + b for the eclipse
+#   duration in [s], per LTAN in [h], see Orbit.eclipse_regression()
+ECLIPSE_REGRESSION = {10.0 : (-151, 2965),
+                      10.5 : (-125, 2860),
+                      11.0 : (-109, 2800)}
+
+# Panels of the satellite, as their normals in the orbit frame (radial,
+#   along-track, orbit normal), see Orbit.sun_profile()
+PANEL_NORMALS = {"zenith" : (1, 0, 0),
+                 "nadir"  : (-1, 0, 0),
+                 "ram"    : (0, 1, 0),
+                 "wake"   : (0, -1, 0),
+                 "north"  : (0, 0, 1),
+                 "south"  : (0, 0, -1)}
+
+
+def scalar(value):
+    """Returns value as a plain number if it holds a single one."""
+    return value.item() if np.ndim(value) == 0 else value
+
+
 class Orbit:
-    """This class stores and supplies orbital parameters for given circular 
-    SSO orbit"""
-    
+    """This class stores and supplies orbital parameters for given circular
+    SSO orbit. h, i and LTAN can be numbers or arrays, which are broadcast
+    against each other, in which case every method returns an array with
+    a value for every orbit."""
+
     def __init__(self,h,i,LTAN):
         self.h = h #[km]
         self.i = i #[deg]
         self.LTAN = LTAN #0-23[h] e.g. 14 is 14:00
-    
-    
+
+
     def period(self):
         """
         Parameters
@@ -33,21 +60,72 @@ class Orbit:
             Orbital period in [s].
 
         """
-        return int(2*3.141593 * ((1000*(6371+self.h))**3/(3.986*10**14))**0.5)
-    
-    def eclipse(self):
+        # As floats, since cubing an integer altitude in [m] overflows
+        h = np.asarray(self.h, dtype=float)
+        period = 2*3.141593 * ((1000*(R_EARTH+h))**3/(3.986*10**14))**0.5
+        return scalar(np.floor(period).astype(int))
+
+    def beta(self, declination=0.):
+        """
+        Parameters
+        ----------
+        declination : double, optional
+            Declination of the Sun in [deg], from -23.44 at the December
+            solstice to 23.44 at the June solstice. Defaults to 0, as at
+            the equinoxes.
+
+        Returns
+        -------
+        double
+            Beta angle in [deg], the angle between the orbital plane and
+            the direction of the Sun.
+
+        """
+        i = np.radians(np.asarray(self.i, dtype=float))
+        # Right ascension of the ascending node relative to the Sun
+        raan = np.radians(15*(np.asarray(self.LTAN, dtype=float) - 12))
+        declination = np.radians(declination)
+
+        sin_beta = np.cos(declination)*np.sin(i)*np.sin(raan) \
+            + np.sin(declination)*np.cos(i)
+        return scalar(np.degrees(np.arcsin(np.clip(sin_beta, -1, 1))))
+
+    def eclipse(self, declination=0.):
+        """
+        Parameters
+        ----------
+        declination : double, optional
+            Declination of the Sun in [deg], see Orbit.beta().
+
+        Returns
+        -------
+        double
+            Total eclipse duration in [s], in the shadow of the Earth taken
+            as a cylinder. For LTAN 10:30 at the equinoxes, this agrees
+            with the regression of GMAT data (see eclipse_regression()) to
+            within a few seconds.
+
+        """
+        return scalar(self.eclipse_angle(declination)/np.pi*self.period())
+
+    def eclipse_angle(self, declination=0.):
+        """Returns half of the arc of the orbit in eclipse, in [rad]."""
+        h = np.asarray(self.h, dtype=float)
+        cos_beta = np.cos(np.radians(self.beta(declination)))
+
+        # Eclipsed where the distance to the Sun-Earth line is below R_EARTH
+        cos_angle = np.sqrt(h**2 + 2*R_EARTH*h)/((R_EARTH+h)*cos_beta)
+        return np.where(cos_angle < 1, \
+                        np.arccos(np.minimum(cos_angle, 1)), 0.)
+
+    def eclipse_regression(self):
         """
-        eclipse(h)
         Note: Only valid between LTAN [10:00, 11:00], based on logarithmic
             regression of simulated eclipse data in GMAT. For more info,
-            consult eclipse_predictions.xlsx.
-            
+            consult eclipse_predictions.xlsx. Between the LTANs of the
+            regressions, the coefficients are interpolated.
+
         ACCURATE TO WITHIN A FEW SECONDS
-        
-        Parameters
-        ----------
-        h : double
-            Orbital altitude in [km].
 
         Returns
         -------
@@ -55,36 +133,106 @@ class Orbit:
             Total eclipse duration (including penumbras) in [s].
 
         """
-        
-        # If LTAN is 10:00
-        # e = -151*log(self.h) + 2965 # [s]
-        
-        # If LTAN is 10:30
-        e = -125*log(self.h) + 2860 # [s]
-        
-        # If LTAN is 11:00
-        # e = -109*log(self.h) + 2800 # [s]        
-
-        return e
-    
-    def eclipse_frac(self):
+        ltans = list(ECLIPSE_REGRESSION)
+        a = np.interp(self.LTAN, ltans, \
+                      [ECLIPSE_REGRESSION[l][0] for l in ltans])
+        b = np.interp(self.LTAN, ltans, \
+                      [ECLIPSE_REGRESSION[l][1] for l in ltans])
+
+        return scalar(a*log(np.asarray(self.h, dtype=float)) + b) # [s]
+
+    def eclipse_frac(self, declination=0.):
         """
-        eclipse(h)
-        Note: Only valid for LTAN 10:00, 10:30, 11:00, based on logarithmic
-            regression of simulated eclipse data in GMAT. For more info,
-            consult eclipse_predictions.xlsx.
-            
-        ACCURACY TO WITHIN 0.1 OF TRUE VALUE
-        
         Parameters
         ----------
-        h : double
-            Orbital altitude in [km].
+        declination : double, optional
+            Declination of the Sun in [deg], see Orbit.beta().
 
         Returns
         -------
         double
-            Percentage of orbit that is in ECLIPSE [%].
+            Fraction of the orbit that is in eclipse.
+
+        """
+        return scalar(self.eclipse_angle(declination)/np.pi)
+
+    def sun_direction(self, samples, declination=0.):
+        """Returns the direction of the Sun in the orbit frame of the
+        satellite (radial, along-track, orbit normal) at samples points
+        evenly spread over one orbit, starting closest to the Sun, as an
+        array with shape (..., samples, 3). Also returns whether the
+        satellite is in eclipse at each point, with shape (..., samples)."""
+
+        beta = np.radians(np.asarray(self.beta(declination)))[..., None]
+        angle = 2*np.pi*np.arange(samples)/samples
+
+        direction = np.stack(np.broadcast_arrays(np.cos(beta)*np.cos(angle), \
+                                                 -np.cos(beta)*np.sin(angle), \
+                                                 np.sin(beta)), axis=-1)
+
+        # Eclipsed within the eclipse angle of the point furthest from the
+        #   Sun, halfway through the orbit.
+        eclipse = np.abs(angle - np.pi) \
+            < np.asarray(self.eclipse_angle(declination))[..., None]
+
+        return direction, eclipse
+
+    def sun_profile(self, samples=500, power=1., panels=None, \
+                    declination=0.):
+        """
+        Parameters
+        ----------
+        samples : int, optional
+            Number of samples over one orbit. Defaults to 500.
+        power : double, optional
+            Power in [W] of one panel facing the Sun head-on. Defaults to 1.
+        panels : dict, optional
+            Relative size of the panels on each face of a nadir-pointing
+            satellite, keyed by "zenith", "nadir", "ram", "wake", "north"
+            and "south". Defaults to a panel of size 1 on every face.
+        declination : double, optional
+            Declination of the Sun in [deg], see Orbit.beta().
+
+        Returns
+        -------
+        ndarray
+            Input power in [W] from direct sunlight over one orbit, shaped
+            like P_sun.npy: the first sample is closest to the Sun and the
+            eclipse lies in the middle. For arrays of orbits, the shape is
+            (..., samples).
+
+        """
+        if panels is None:
+            panels = dict.fromkeys(PANEL_NORMALS, 1.)
+
+        direction, eclipse = self.sun_direction(samples, declination)
+
+        profile = 0.
+        for face, size in panels.items():
+            incidence = direction @ np.array(PANEL_NORMALS[face], float)
+            profile = profile + size*np.maximum(incidence, 0)
+
+        return np.where(eclipse, 0., power*profile)
+
+    def albedo_profile(self, samples=500, power=1., declination=0.):
+        """
+        Parameters
+        ----------
+        samples : int, optional
+            Number of samples over one orbit. Defaults to 500.
+        power : double, optional
+            Power in [W] on the nadir panel above the sub-solar point.
+            Defaults to 1.
+        declination : double, optional
+            Declination of the Sun in [deg], see Orbit.beta().
+
+        Returns
+        -------
+        ndarray
+            Input power in [W] from sunlight reflected by the Earth over one
+            orbit, shaped like P_alb.npy, taken to scale with the elevation
+            of the Sun at the point below the satellite.
 
         """
-        return self.eclipse()/self.period()
\ No newline at end of file
+        direction, _ = self.sun_direction(samples, declination)
+        return power*np.maximum(direction[..., 0], 0)
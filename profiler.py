@@ -0,0 +1,65 @@
+"""
+profiler.py
+
+"Specification of the Profiler class, which times the phases of a single
+    propagation of a Mission."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import contextlib
+import time
+
+
+class Profiler:
+    """This class collects the wall time spent in each phase of one call to
+    a propagation method of Mission, along with counts such as the number
+    of steps, and the largest size of the simulation data held at once.
+
+    Phases can be nested. The time of a phase then excludes the time of the
+    phases within it, so that the times of all phases add up to at most
+    the total time."""
+
+    def __init__(self, method):
+        self.method = method
+        self.phases = {}
+        self.counts = {}
+        self.result_bytes = 0
+        self.nested = []
+        self.begin = time.perf_counter()
+        self.total = None
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        self.nested.append(0.)
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            inner = self.nested.pop()
+            self.phases[name] = self.phases.get(name, 0.) + elapsed - inner
+            if self.nested:
+                self.nested[-1] += elapsed
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def memory(self, nbytes):
+        self.result_bytes = max(self.result_bytes, int(nbytes))
+
+    def finish(self):
+        """Stops the clock, and returns the report."""
+        self.total = time.perf_counter() - self.begin
+        return self.report()
+
+    def report(self):
+        """Returns a dict with the method, the total time in [s], the time
+        in [s] of every phase, every count, and the largest size of the
+        simulation data in bytes."""
+        report = {"method" : self.method,
+                  "total" : self.total,
+                  "phases" : dict(self.phases)}
+        report.update(self.counts)
+        report["result_bytes"] = self.result_bytes
+        return report
@@ -0,0 +1,126 @@
+"""
+report.py
+
+"Renders the full set of plots of a Mission to image files, either for the
+    last simulation or for many schedules in parallel worker processes."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import os
+from concurrent.futures import as_completed
+
+import matplotlib
+import matplotlib.pyplot as plt
+
+import runner
+from runner import ScheduleRunner
+
+
+# Plots of a report, with the Mission method drawing each of them
+plots = {
+    "timeline_power"            : "plot_timeline_power",
+    "timeline_device"           : "plot_timeline_device",
+    "timeline_channel"          : "plot_timeline_channel",
+    "timeline_channel_currents" : "plot_timeline_channel_currents",
+    "pie_device"                : "plot_pie_device",
+    "pie_opstate"               : "plot_pie_opstate",
+    "bar_channel"               : "plot_bar_channel",
+    }
+
+
+def render_plots(mission, directory, opstate_colours, channel_voltages, \
+                 name="report", formats=("png",), selection=None, dpi=100):
+    """Renders the plots of the last simulation of the mission to files in
+    directory, named <name>_<plot>.<format>, and returns their paths.
+    formats can hold any format matplotlib can save to, such as "png",
+    "svg" and "pdf". selection is a list of keys of report.plots, all of
+    them by default.
+
+    Every figure is closed as soon as it is saved, and none is ever shown,
+    so this can be called any number of times without blocking or holding
+    on to memory."""
+
+    os.makedirs(directory, exist_ok=True)
+
+    arguments = {
+        "timeline_power"            : (opstate_colours,),
+        "timeline_channel_currents" : (channel_voltages,),
+        "pie_opstate"               : (opstate_colours,),
+        }
+    showing = ("timeline_power", "pie_device", "pie_opstate")
+
+    paths = []
+    for plot in (selection if selection is not None else plots):
+        method = getattr(mission, plots[plot])
+
+        figures = set(plt.get_fignums())
+        if plot in showing:
+            method(*arguments.get(plot, ()), show=False)
+        else:
+            method(*arguments.get(plot, ()))
+
+        for number in set(plt.get_fignums()) - figures:
+            figure = plt.figure(number)
+            for extension in formats:
+                path = os.path.join(directory, "{}_{}.{}".format( \
+                    name, plot, extension))
+                figure.savefig(path, dpi=dpi)
+                paths.append(path)
+            plt.close(figure)
+
+    return paths
+
+
+def _init_report_worker(*args):
+    """Sets up a worker process like runner._init_worker(), and makes it
+    draw without a display."""
+    matplotlib.use("Agg")
+    runner._init_worker(*args)
+
+
+def _render_schedule(key, schedule, tsim, dt, mode, directory, \
+                     opstate_colours, channel_voltages, formats, selection, \
+                     dpi):
+    """Propagates a single schedule on the Mission of this worker, and
+    renders its plots."""
+    mission = runner._propagate(schedule, tsim, dt, mode, compact=True)
+
+    paths = render_plots(mission, directory, opstate_colours, \
+                         channel_voltages, str(key), formats, selection, dpi)
+    mission.reset_sim_data()
+
+    return key, paths
+
+
+class ReportRenderer(ScheduleRunner):
+    """This class renders the plots of many candidate schedules for a
+    Mission to files, across all processor cores. Every worker process
+    propagates its schedules and draws their plots with the non-interactive
+    Agg backend, so that rendering a report for a hundred runs is a single
+    batch job."""
+
+    initializer = staticmethod(_init_report_worker)
+
+    def render(self, schedules, directory, opstate_colours, \
+               channel_voltages, formats=("png",), selection=None, dpi=100):
+        """Propagates every schedule and renders its plots to directory,
+        and yields (key, paths) as soon as each schedule is done, in order
+        of completion. schedules is either a dict of schedules or any other
+        iterable of schedules, as for ScheduleRunner.run(). The files of
+        each schedule are named after its key, see render_plots()."""
+
+        if isinstance(schedules, dict):
+            items = schedules.items()
+        else:
+            items = enumerate(schedules)
+
+        futures = [self.pool.submit(_render_schedule, key, schedule, \
+                                    self.tsim, self.dt, self.mode, \
+                                    directory, opstate_colours, \
+                                    channel_voltages, formats, selection, \
+                                    dpi) \
+                   for key, schedule in items]
+
+        for future in as_completed(futures):
+            yield future.result()
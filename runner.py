@@ -0,0 +1,147 @@
+"""
+runner.py
+
+"Specification of the ScheduleRunner class, which propagates many candidate
+    schedules for the same Mission in parallel worker processes."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import contextlib
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from mission import Mission
+
+
+# Mission of the current worker process, set up once by _init_worker()
+_worker_mission = None
+_worker_blocks = []
+
+
+def _share(array):
+    """Copies an array into a new block of shared memory, and returns the
+    block along with the (name, shape, dtype) needed to attach to it."""
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes,1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _attach(spec):
+    """Returns a view on an array in shared memory, as made by _share()."""
+    name, shape, dtype = spec
+    block = shared_memory.SharedMemory(name=name)
+    # Keep the block open for as long as the worker lives
+    _worker_blocks.append(block)
+    return np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _init_worker(config, device_channels, state_list, channels, \
+                 power_spec, power_index, power_columns, p_sun_spec, \
+                 p_alb_spec, profile_library=None):
+    """Builds the Mission of a worker process from shared memory. This runs
+    once per worker, so every schedule it gets only carries its own data."""
+    global _worker_mission
+
+    power_frame = pd.DataFrame(_attach(power_spec), index=power_index, \
+                               columns=power_columns, copy=False)
+
+    _worker_mission = Mission(config, device_channels, state_list, \
+                              channels, power_frame, _attach(p_sun_spec), \
+                              _attach(p_alb_spec))
+    _worker_mission.use_profile_library(profile_library)
+
+
+def _propagate(schedule, tsim, dt, mode, compact=False):
+    """Propagates a single schedule on the Mission of this worker, and
+    returns the Mission."""
+
+    # Keep the console output of the workers out of the way
+    with contextlib.redirect_stdout(io.StringIO()):
+        _worker_mission.propagate(schedule, tsim=tsim, dt=dt, mode=mode, \
+                                  compact=compact)
+    return _worker_mission
+
+
+def _run_schedule(key, schedule, tsim, dt, mode, return_data):
+    """Propagates a single schedule on the Mission of this worker."""
+    _propagate(schedule, tsim, dt, mode)
+
+    summary = _worker_mission.summarize()
+    if return_data:
+        return key, summary, _worker_mission.sim_data
+    return key, summary
+
+
+class ScheduleRunner:
+    """This class propagates many candidate schedules for a Mission across
+    all processor cores. The power frame, p_sun and p_alb are placed in
+    shared memory once, and every worker process builds its OpStates from
+    them when it starts, so that each schedule is sent to a worker on its
+    own. A memory-mapped profile library of the Mission is opened again by
+    every worker, rather than copied."""
+
+    # Sets up the Mission of each worker process when it starts
+    initializer = staticmethod(_init_worker)
+
+    def __init__(self, mission, tsim=10, dt=1, mode="step", workers=None):
+
+        self.tsim = tsim
+        self.dt = dt
+        self.mode = mode
+        self.workers = workers if workers else os.cpu_count()
+
+        power_frame = mission.power_frame.astype(float)
+
+        power_block, power_spec = _share(power_frame.to_numpy())
+        p_sun_block, p_sun_spec = _share(mission.p_sun)
+        p_alb_block, p_alb_spec = _share(mission.p_alb)
+        self.blocks = [power_block, p_sun_block, p_alb_block]
+
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, \
+            initializer=self.initializer, \
+            initargs=(mission.config, mission.device_channels, \
+                      mission.state_list, mission.channels, power_spec, \
+                      list(power_frame.index), list(power_frame.columns), \
+                      p_sun_spec, p_alb_spec, mission.profile_library))
+
+    def run(self, schedules, return_data=False):
+        """Propagates every schedule, and yields (key, summary) as soon as
+        each schedule is done, in order of completion. schedules is either
+        a dict of schedules, in which case key is the dict key, or any other
+        iterable of schedules, in which case key is its position. summary is
+        as given by Mission.summarize(). If return_data is set, the full
+        simulation dataframe is yielded as a third element."""
+
+        if isinstance(schedules, dict):
+            items = schedules.items()
+        else:
+            items = enumerate(schedules)
+
+        futures = [self.pool.submit(_run_schedule, key, schedule, \
+                                    self.tsim, self.dt, self.mode, \
+                                    return_data) \
+                   for key, schedule in items]
+
+        for future in as_completed(futures):
+            yield future.result()
+
+    def close(self):
+        """Shuts down the worker processes and frees the shared memory."""
+        self.pool.shutdown()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,167 @@
+"""
+schedule.py
+
+"Specification of the Schedule class, which holds an OpState schedule as
+    sorted arrays of switch times and OpState indices."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class Schedule:
+    """This class stores a schedule as an array of switch times in [s],
+    sorted in ascending order, and an array with the index into state_list
+    of the OpState that starts at each of them.
+
+    Indexing and iterating over a Schedule gives (time, OpState) tuples,
+    like the sorted items of the schedule dict it was compiled from."""
+
+    def __init__(self, times, states, state_list):
+        self.times = np.asarray(times)
+        self.states = np.asarray(states, dtype=int)
+        self.state_list = list(state_list)
+
+    @classmethod
+    def compile(cls, schedule, state_list):
+        """Compiles a schedule given as a dict of {time: OpState}, or as a
+        sequence of (time, OpState) pairs, into a Schedule. A Schedule is
+        compiled again only if it uses a different state_list, and a
+        PeriodicSchedule is expanded into all of its repeats.
+
+        Raises a ValueError listing every OpState of the schedule that is
+        not in state_list."""
+
+        if isinstance(schedule, PeriodicSchedule):
+            return schedule.expand(state_list)
+
+        if isinstance(schedule, Schedule):
+            if schedule.state_list == list(state_list):
+                return schedule
+            schedule = list(schedule)
+
+        if isinstance(schedule, dict):
+            times = np.asarray(list(schedule.keys()))
+            names = list(schedule.values())
+        else:
+            times = np.asarray([entry[0] for entry in schedule])
+            names = [entry[1] for entry in schedule]
+
+        # Look up all OpStates at once, unknown ones come out as -1
+        states = pd.Index(state_list).get_indexer(names)
+        if np.any(states < 0):
+            unknown = sorted(set(np.asarray(names, dtype=object) \
+                                 [states < 0]))
+            raise ValueError("Schedule contains OpStates that are not in \
+                             state_list: {}".format(unknown))
+
+        order = np.argsort(times, kind="stable")
+        return cls(times[order], states[order], state_list)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, i):
+        return (self.times[i].item(), self.state_list[self.states[i]])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def opstates(self):
+        """The OpState of every entry, as an array of names."""
+        return np.array(self.state_list, dtype=object)[self.states]
+
+    def to_dict(self):
+        return dict(zip(self.times.tolist(), self.opstates))
+
+    def entry_index(self, t):
+        """Returns the latest entry that has started at each of the given
+        times. Times before the first entry get the first entry.
+
+        Unlike engine.schedule_index(), this does not hold the schedule back
+        to one entry per timestep."""
+        return np.maximum(np.searchsorted(self.times, t, side="right")-1, 0)
+
+    def opstate_index(self, t):
+        """Returns the index into state_list of the OpState that is active
+        at each of the given times, see entry_index()."""
+        return self.states[self.entry_index(t)]
+
+    def first_difference(self, other):
+        """Returns the first entry at which this schedule differs from
+        another, or the length of the shorter one if it has no entry that
+        differs from the other."""
+        n = min(len(self), len(other))
+        differs = (self.times[:n] != other.times[:n]) \
+            | (self.states[:n] != other.states[:n])
+        return int(np.argmax(differs)) if np.any(differs) else n
+
+    def check_timestep(self, dt):
+        """Returns the number of entries that start less than one timestep
+        after the previous entry, and the number of other entries that start
+        less than two timesteps after it, at a time that is not a multiple
+        of dt.
+
+        The schedule moves forward by at most one entry per timestep, so the
+        former are picked up late, and the latter may be, depending on the
+        rounding of the simulation times."""
+        increments = np.diff(self.times)
+        steps = self.times[1:]/dt
+        misaligned = ~np.isclose(steps, np.round(steps))
+        late = increments < dt
+        return int(np.count_nonzero(late)), \
+            int(np.count_nonzero(~late & (increments < 2*dt) & misaligned))
+
+
+class PeriodicSchedule:
+    """This class stores a schedule that repeats a template every period
+    seconds, either a given number of times or up to a given end time. The
+    template is a schedule of one period, with times in [0, period), given
+    as a dict of {time: OpState} or as a Schedule. The period is usually a
+    whole number of orbits.
+
+    Mission.propagate_periodic() propagates one period only, and carries the
+    battery over from one period to the next. Anywhere else, the schedule
+    is expanded into every repeat of the template."""
+
+    def __init__(self, template, period, repeats=None, end=None):
+        if (repeats is None) == (end is None):
+            raise ValueError("A PeriodicSchedule needs either a number of \
+                             repeats or an end time!")
+
+        times = np.asarray([entry[0] for entry in template] \
+                           if isinstance(template, Schedule) \
+                           else list(template.keys()))
+        if len(times) == 0 or times.min() != 0 or times.max() >= period:
+            raise ValueError("The template of a PeriodicSchedule must start \
+                             at 0, and end before the period!")
+
+        self.template = template
+        self.period = period
+        self.repeats = repeats
+        self.end = end
+
+    def cycles(self):
+        """Returns the number of periods that the schedule starts, counting
+        a period that is cut short by the end time."""
+        if self.repeats is not None:
+            return int(self.repeats)
+        return int(np.floor(self.end/self.period)) + 1
+
+    def expand(self, state_list):
+        """Returns the Schedule of all repeats of the template."""
+        template = Schedule.compile(self.template, state_list)
+
+        starts = np.arange(self.cycles())*self.period
+        times = np.add.outer(starts, template.times).ravel()
+        states = np.tile(template.states, len(starts))
+
+        if self.end is not None:
+            keep = times <= self.end
+            times, states = times[keep], states[keep]
+
+        return Schedule(times, states, state_list)
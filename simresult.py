@@ -0,0 +1,100 @@
+"""
+simresult.py
+
+"Specification of the SimResult class, a compact alternative to the
+    simulation dataframe."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class SimResult:
+    """This class stores the outcome of a simulation using only the columns
+    that change independently from step to step: t, the OpState index, p_in,
+    p_out, sun and battery. The power of every channel and device only
+    depends on the OpState, so these columns are looked up from a table of
+    OpStates when they are asked for, rather than stored for every step.
+
+    Columns are accessed like those of the simulation dataframe, e.g.
+    result["battery"] or result["5V_1"], and are returned as NumPy arrays.
+    Slicing, e.g. result[:100], returns a SimResult with the given steps."""
+
+    def __init__(self, t, opstate_idx, p_in, p_out, sun, battery, \
+                 opstates, channels, devices, channel_table, device_table):
+
+        self.data = {
+            "t"         : t,
+            "OpState"   : opstate_idx,
+            "p_in"      : p_in,
+            "p_out"     : p_out,
+            "sun"       : sun,
+            "battery"   : battery,
+            }
+
+        self.opstates = np.array(opstates, dtype=object)
+
+        # Lookup of each channel and device in its OpState table
+        self.tables = {}
+        for j, channel in enumerate(channels):
+            self.tables[channel] = channel_table[:, j]
+        for j, device in enumerate(devices):
+            self.tables[device] = device_table[:, j]
+
+        self.channels = channels
+        self.devices = devices
+        self.channel_table = channel_table
+        self.device_table = device_table
+
+        self.columns = list(self.data.keys()) + list(channels) + \
+            list(devices)
+
+    def __len__(self):
+        return len(self.data["t"])
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return SimResult(*[values[key] for values in self.data.values()],
+                             self.opstates, self.channels, self.devices, \
+                             self.channel_table, self.device_table)
+
+        if key == "OpState":
+            return self.opstates[self.data["OpState"]]
+        if key in self.data:
+            return self.data[key]
+        if key in self.tables:
+            return self.tables[key][self.data["OpState"]]
+
+        raise KeyError(key)
+
+    @property
+    def opstate_idx(self):
+        """Index of the OpState at each step, into self.opstates."""
+        return self.data["OpState"]
+
+    @property
+    def nbytes(self):
+        """Memory used by the stored columns in bytes."""
+        return sum(values.nbytes for values in self.data.values())
+
+    def to_frame(self):
+        """Returns the full simulation dataframe, with every channel and
+        device column filled in."""
+        return pd.DataFrame({column: self[column] \
+                             for column in self.columns}, \
+                            columns=self.columns)
+
+    @staticmethod
+    def concat(results):
+        """Joins SimResults of consecutive runs of steps into one."""
+        first = results[0]
+        return SimResult(*[np.concatenate([result.data[column] \
+                                           for result in results]) \
+                           for column in first.data], \
+                         first.opstates, first.channels, first.devices, \
+                         first.channel_table, first.device_table)
@@ -0,0 +1,83 @@
+"""
+sink.py
+
+"Specification of the ColumnSink class, which writes simulation data to disk
+    chunk by chunk, one file per column."
+
+@author: Johan Monster (https://github.com/Hans-Bananendans/)
+"""
+
+import json
+import os
+
+import numpy as np
+
+
+class ColumnSink:
+    """This class stores the output of Mission.propagate_stream() on disk.
+    Every column is appended to its own raw binary file as the chunks come
+    in, so that only one chunk is ever held in memory. The OpState column
+    is stored as an index into the list of OpStates.
+
+    The stored data can be read back with ColumnSink.load(), which maps the
+    files into memory rather than reading them."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+        self.meta = None
+
+    def open(self, columns, opstates):
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.opstates = {opstate: i for i, opstate in enumerate(opstates)}
+        self.meta = {"columns" : list(columns),
+                     "opstates" : list(opstates),
+                     "dtypes" : {},
+                     "length" : 0}
+        self.files = {column: open(self.path(i), "wb") \
+                      for i, column in enumerate(columns)}
+
+    def path(self, i):
+        return os.path.join(self.directory, "column_{}.bin".format(i))
+
+    def write(self, chunk):
+        for column, file in self.files.items():
+            if column == "OpState":
+                values = chunk[column].map(self.opstates).to_numpy(np.int32)
+            else:
+                values = chunk[column].to_numpy()
+
+            self.meta["dtypes"][column] = values.dtype.str
+            values.tofile(file)
+
+        self.meta["length"] += len(chunk)
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+        self.files = {}
+
+        with open(os.path.join(self.directory, "columns.json"), "w") as file:
+            json.dump(self.meta, file)
+
+    @staticmethod
+    def load(directory):
+        """Returns a dict with a read-only memory-mapped array for every
+        column written to the directory, along with the list of OpStates
+        that the values in the OpState column refer to."""
+
+        with open(os.path.join(directory, "columns.json")) as file:
+            meta = json.load(file)
+
+        data = {}
+        for i, column in enumerate(meta["columns"]):
+            path = os.path.join(directory, "column_{}.bin".format(i))
+            if meta["length"] == 0:
+                data[column] = np.zeros(0)
+            else:
+                data[column] = np.memmap(path, mode="r", \
+                                         dtype=meta["dtypes"][column], \
+                                         shape=(meta["length"],))
+
+        return data, meta["opstates"]